@@ -1,5 +1,5 @@
 from .absorient import absOrient
-from .addedSubtractedTransitioned import addedSubtractedTransitioned
+from .addedSubtractedTransitioned import addedSubtractedTransitioned, addedSubtractedTransitionedWithLookup
 from .allBranches import allBranches
 from .allPuncta import allPuncta
 from .allTrees import allTrees
@@ -1,9 +1,10 @@
+import itertools
 import numpy as np
 
-from typing import Any, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import pydynamo_brain.util as util
-from pydynamo_brain.model import Tree, FiloType
+from pydynamo_brain.model import Branch, Tree, FiloType
 
 def addedSubtractedTransitioned(
     trees: List[Tree],
@@ -25,7 +26,20 @@ def addedSubtractedTransitioned(
     Returns:
         TODO
     """
+    filoTypes, added, subtracted, transitioned, masterChanged, masterNodes, _ = \
+        addedSubtractedTransitionedWithLookup(trees, excludeAxon, excludeBasal, terminalDist, filoDist)
+    return filoTypes, added, subtracted, transitioned, masterChanged, masterNodes
 
+def addedSubtractedTransitionedWithLookup(
+    trees: List[Tree],
+    excludeAxon: bool=True,
+    excludeBasal: bool=True,
+    terminalDist: float=10.0,
+    filoDist: float=10.0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, Dict[str, int]]:
+    """Same as addedSubtractedTransitioned, but also returns the lookup of branch ID to
+    result column, so other analyses (e.g. motility) can share the same layout.
+    """
     nTrees = len(trees)
     branchIDList = util.sortedBranchIDList(trees)
     nBranches = len(branchIDList)
@@ -36,52 +50,121 @@ def addedSubtractedTransitioned(
 
     resultShape = (nTrees, nBranches)
 
-    # Outputs:
-    filoTypes = np.full(resultShape, FiloType.ABSENT)
-    addedResult = np.full(resultShape, False)
-    subtracted = np.full(resultShape, False)
-    transitioned = np.full(resultShape, False)
-    masterChanged = np.full((nTrees - 1, nBranches), False)
+    # Outputs: filo types fit in int8, and the four change masks share one boolean buffer.
+    filoTypes = np.full(resultShape, int(FiloType.ABSENT), dtype=np.int8)
+    changeShape = (nTrees - 1, nBranches)
+    added, subtracted, transitioned, masterChanged = np.zeros((4,) + changeShape, dtype=np.bool_)
     masterNodes = util.emptyArrayMatrix(nTrees, nBranches)
 
+    # Most branches don't change between timepoints, so share lengths of identical branches:
+    sharedLengths: Dict[Tuple[Any, ...], Tuple[float, float, List[float]]] = {}
     for treeIdx, tree in enumerate(trees):
         if trees[treeIdx] is not None and len(trees[treeIdx].branches) > 0: # Skip empty trees
+            # Start a new pass, so branch lengths are calculated once then reused:
+            trees[treeIdx].invalidateCachedLengths()
+            trees[treeIdx].shareCachedLengths(sharedLengths)
             treeRoot = trees[treeIdx].rootPoint
             if treeRoot is not None:
+                branchesByIdx, excluded = _branchArrays(
+                    trees[treeIdx], branchIDLookup, nBranches, excludeAxon, excludeBasal
+                )
                 for branch in treeRoot.children:
-                    branchIdx = branchIDList.index(branch.id)
-                    _recursiveFiloTypes(
-                        branchIDList, filoTypes, masterNodes, trees, treeIdx, branchIdx,
-                        excludeAxon, excludeBasal, terminalDist, filoDist
+                    branchIdx = branchIDLookup[branch.id]
+                    _calcFiloTypes(
+                        branchesByIdx, excluded, branchIDLookup, filoTypes, masterNodes, treeIdx, branchIdx,
+                        terminalDist, filoDist
                     )
+            # Lengths stay cached on the branches, but the tree shouldn't keep the shared map:
+            trees[treeIdx].shareCachedLengths(None)
 
-    filoExists = (filoTypes > FiloType.ABSENT)
-    filos = filoExists & (filoTypes < FiloType.BRANCH_ONLY) # NOTE: brackets needed for numpy precendence
-    branches = (filoTypes > FiloType.TERMINAL)
-    branchWithFilo = (branches & filos)
-    justBranches = (filoTypes == FiloType.BRANCH_ONLY)
+    filoExists = np.greater(filoTypes, FiloType.ABSENT)
+    filos = np.less(filoTypes, FiloType.BRANCH_ONLY)
+    np.logical_and(filos, filoExists, out=filos)
+    branches = np.greater(filoTypes, FiloType.TERMINAL)
+    branchWithFilo = np.logical_and(branches, filos)
+    justBranches = np.equal(filoTypes, FiloType.BRANCH_ONLY)
     justBranchBefore, justBranchAfter = justBranches[:-1, :], justBranches[1:, :]
     branchWithFiloBefore, branchWithFiloAfter = branchWithFilo[:-1, :], branchWithFilo[1:, :]
     filoBefore, filoAfter = filos[:-1, :], filos[1:, :]
     existBefore, existAfter = filoExists[:-1, :], filoExists[1:, :]
-    added = (~existBefore & filoAfter) | (justBranchBefore & branchWithFiloAfter)
-    subtracted = (filoBefore & ~existAfter) | (branchWithFiloBefore & justBranchAfter)
-    transitioned = filoBefore & ~branches[:-1, :] & branches[1:, :]
+    branchesBefore, branchesAfter = branches[:-1, :], branches[1:, :]
+
+    # Combine in place, with one scratch array, rather than a temporary per operator:
+    scratch = np.empty(changeShape, dtype=np.bool_)
+    # added = (~existBefore & filoAfter) | (justBranchBefore & branchWithFiloAfter)
+    np.logical_not(existBefore, out=added)
+    np.logical_and(added, filoAfter, out=added)
+    np.logical_and(justBranchBefore, branchWithFiloAfter, out=scratch)
+    np.logical_or(added, scratch, out=added)
+    # subtracted = (filoBefore & ~existAfter) | (branchWithFiloBefore & justBranchAfter)
+    np.logical_not(existAfter, out=subtracted)
+    np.logical_and(subtracted, filoBefore, out=subtracted)
+    np.logical_and(branchWithFiloBefore, justBranchAfter, out=scratch)
+    np.logical_or(subtracted, scratch, out=subtracted)
+    # transitioned = filoBefore & ~branchesBefore & branchesAfter
+    np.logical_not(branchesBefore, out=transitioned)
+    np.logical_and(transitioned, filoBefore, out=transitioned)
+    np.logical_and(transitioned, branchesAfter, out=transitioned)
 
     fillMasterChanged(masterChanged, masterNodes)
     added[masterChanged] = False
     subtracted[masterChanged] = False
 
-    return filoTypes, added, subtracted, transitioned, masterChanged, masterNodes
+    return filoTypes, added, subtracted, transitioned, masterChanged, masterNodes, branchIDLookup
+
+# Lay out a tree's branches by column in the results, plus which columns are excluded from
+# analysis (empty, axon or basal branches), so the walk below needs no per-branch searches.
+def _branchArrays(
+    tree: Tree, branchIDLookup: Dict[str, int], nBranches: int, excludeAxon: bool, excludeBasal: bool
+) -> Tuple[List[Optional[Branch]], np.ndarray]:
+    branchesByIdx: List[Optional[Branch]] = [None] * nBranches
+    for branch in tree.branches:
+        branchIdx = branchIDLookup.get(branch.id)
+        if branchIdx is not None and branchesByIdx[branchIdx] is None:
+            branchesByIdx[branchIdx] = branch
 
-def _recursiveFiloTypes(
-    branchIDList: List[str], filoTypes: np.ndarray, masterNodes: np.ndarray,
-    trees: List[Tree], treeIdx: int, branchIdx: int,
-    excludeAxon: bool, excludeBasal: bool, terminalDist: float, filoDist: float
+    excluded = np.full(nBranches, False)
+    axonMemo: Dict[int, bool] = {}
+    basalMemo: Dict[int, bool] = {}
+    for branchIdx, indexedBranch in enumerate(branchesByIdx):
+        if indexedBranch is not None:
+            excluded[branchIdx] = indexedBranch.isEmpty() or \
+                (excludeAxon and indexedBranch.hasPointWithAnnotation('axon', recurseUp=True, memo=axonMemo)) or \
+                (excludeBasal and indexedBranch.hasPointWithAnnotation('basal', recurseUp=True, memo=basalMemo))
+    return branchesByIdx, excluded
+
+def _calcFiloTypes(
+    branchesByIdx: List[Optional[Branch]], excluded: np.ndarray, branchIDLookup: Dict[str, int],
+    filoTypes: np.ndarray, masterNodes: np.ndarray, treeIdx: int, branchIdx: int,
+    terminalDist: float, filoDist: float
 ) -> None:
-    branch = trees[treeIdx].getBranchByID(branchIDList[branchIdx])
+    # Walks the subtree using an explicit stack rather than recursion, so deep trees can't
+    # hit the recursion limit. Each branch yields child branches that need processing
+    # before it can continue, which keeps the same order of updates as a recursive walk.
+    def branchSteps(idx: int) -> Iterator[int]:
+        return _branchFiloTypes(
+            branchesByIdx, excluded, branchIDLookup, filoTypes, masterNodes, treeIdx, idx,
+            terminalDist, filoDist
+        )
+
+    toProcess = [branchSteps(branchIdx)]
+    while len(toProcess) > 0:
+        childBranchIdx = next(toProcess[-1], None)
+        if childBranchIdx is None:
+            toProcess.pop()
+        else:
+            toProcess.append(branchSteps(childBranchIdx))
+
+def _branchFiloTypes(
+    branchesByIdx: List[Optional[Branch]], excluded: np.ndarray, branchIDLookup: Dict[str, int],
+    filoTypes: np.ndarray, masterNodes: np.ndarray, treeIdx: int, branchIdx: int,
+    terminalDist: float, filoDist: float
+) -> Iterator[int]:
+    # Rows for this tree are looked up once, rather than on every write:
+    treeFiloTypes, treeMasterNodes = filoTypes[treeIdx], masterNodes[treeIdx]
+    branch = branchesByIdx[branchIdx]
     if branch is None:
-        filoTypes[treeIdx][branchIdx] = FiloType.ABSENT
+        treeFiloTypes[branchIdx] = FiloType.ABSENT
         return
 
     pointsWithRoot = branch.points
@@ -89,60 +172,61 @@ def _recursiveFiloTypes(
         pointsWithRoot = [branch.parentPoint] + pointsWithRoot
 
     # Exclude: 1) empty branches, plus 2) axons and 3) basal dendrites if not needed.
-    if branch.isEmpty() or (excludeAxon and branch.isAxon()) or (excludeBasal and branch.isBasal()):
-        filoTypes[treeIdx][branchIdx] = FiloType.ABSENT
+    if excluded[branchIdx]:
+        treeFiloTypes[branchIdx] = FiloType.ABSENT
         return
 
     # 4) If the branch has a lamella and no children, abort
-    if (not branch.hasChildren()) and util.lastPointWithLabelIdx(pointsWithRoot, 'lam') >= 0:
-        filoTypes[treeIdx][branchIdx] = FiloType.BRANCH_ONLY
+    lastPointWithChildrenIdx = branch.cachedLastPointWithChildrenIdx()
+    if lastPointWithChildrenIdx < 0 and util.hasPointWithLabel(pointsWithRoot, 'lam'):
+        treeFiloTypes[branchIdx] = FiloType.BRANCH_ONLY
         return
 
     # Walk down each child in turn:
-    totalLength, totalLengthToLastBranch = branch.worldLengths()
-    cumulativeLengths = branch.cumulativeWorldLengths()
+    totalLength, totalLengthToLastBranch, cumulativeLengths = branch.cachedWorldLengths()
+    # Children of each point are resolved up front, so the loops below don't repeat lookups.
+    pointChildren = [point.children for point in branch.points]
+    lastPointIdx = len(pointChildren) - 1
     forceInterstitial = False
-    for pointIdx, point in enumerate(branch.points):
-        if len(point.children) == 0:
+    for pointIdx, children in enumerate(pointChildren):
+        if len(children) == 0:
             continue # Skip childless points
 
         forceInterstitial = False
-        for childBranch in point.children:
+        for childBranch in children:
             if len(childBranch.points) < 1:
                 continue # Skip empty branches
 
-            if childBranch.id not in branchIDList:
+            if childBranch.id not in branchIDLookup:
                 continue # branch is not known? what?
 
-            childBranchIdx = branchIDList.index(childBranch.id)
-            childIsFilo, childLength = childBranch.isFilo(filoDist)
+            childBranchIdx = branchIDLookup[childBranch.id]
+            childIsFilo, childLength = childBranch.isFilo(filoDist, useCachedLengths=True)
             if childIsFilo:
                 distPointToEnd = totalLength - cumulativeLengths[pointIdx]
                 isTerminal = (distPointToEnd < terminalDist)
-                filoTypes[treeIdx][childBranchIdx] = \
+                treeFiloTypes[childBranchIdx] = \
                     FiloType.TERMINAL if isTerminal else FiloType.INTERSTITIAL
 
                 # HACK TODO - figure out what this is doing?
                 # mark branchtip filopodia as branch:
                 # current node has 1 children and is the endpoint
-                if len(point.children) == 1 and pointIdx == len(branch.points) - 1:
-                    filoTypes[treeIdx][childBranchIdx] = FiloType.BRANCH_ONLY
-                    masterNodes[treeIdx][childBranchIdx] = [branchIdx] # we use convention that long branches are their own masternode
+                if len(children) == 1 and pointIdx == lastPointIdx:
+                    treeFiloTypes[childBranchIdx] = FiloType.BRANCH_ONLY
+                    treeMasterNodes[childBranchIdx] = [branchIdx] # we use convention that long branches are their own masternode
 
             else: # Not filo
                 # all terminal filopodia identified so far are actually interstitial
                 forceInterstitial = True
-                _recursiveFiloTypes(branchIDList, filoTypes, masterNodes, trees, treeIdx, childBranchIdx, excludeAxon, excludeBasal, terminalDist, filoDist)
+                yield childBranchIdx
 
         # Turn all previous terminal filos into interstitial filos
         if forceInterstitial:
-            for prevPointIdx, prevPoint in enumerate(branch.points):
-                for childBranch in prevPoint.children:
+            for prevChildren in pointChildren[:pointIdx + 1]:
+                for childBranch in prevChildren:
                     childBranchIdx = childBranch.indexInParent()
-                    if filoTypes[treeIdx][childBranchIdx] == FiloType.TERMINAL:
-                        filoTypes[treeIdx][childBranchIdx] = FiloType.INTERSTITIAL
-                if prevPointIdx == pointIdx:
-                    break
+                    if treeFiloTypes[childBranchIdx] == FiloType.TERMINAL:
+                        treeFiloTypes[childBranchIdx] = FiloType.INTERSTITIAL
 
 
     # deal with potential terminal filopodium that's part of the branch
@@ -152,32 +236,46 @@ def _recursiveFiloTypes(
     # part of this branch is a filopodium
     if totalDist > 0 and totalDist < filoDist:
         #the last child is a branch, so this terminal filo is interstitial
-        filoTypes[treeIdx][branchIdx] = \
+        treeFiloTypes[branchIdx] = \
             FiloType.BRANCH_WITH_INTERSTITIAL if forceInterstitial else FiloType.BRANCH_WITH_TERMINAL
 
         # branches are also defined by a 'master node' that marks the start of any potential temrinal filopodium
-        lastPointWithChildren = None
-        for point in reversed(branch.points):
-            if len(point.children) > 0:
-                lastPointWithChildren = point
-                break
-        if lastPointWithChildren is not None:
-            masterNodes[treeIdx][branchIdx] = [b.indexInParent() for b in lastPointWithChildren.children]
+        if lastPointWithChildrenIdx >= 0:
+            treeMasterNodes[branchIdx] = [b.indexInParent() for b in pointChildren[lastPointWithChildrenIdx]]
 
     elif totalDist == 0: # a trunk branch
         # the last node is the masternode
-        filoTypes[treeIdx][branchIdx] = FiloType.BRANCH_ONLY
-        masterNodes[treeIdx][branchIdx] = [b.indexInParent() for b in branch.points[-1].children]
+        treeFiloTypes[branchIdx] = FiloType.BRANCH_ONLY
+        treeMasterNodes[branchIdx] = [b.indexInParent() for b in pointChildren[-1]]
     else: # a long branch
         # we use convention that long branches are their own masternode
-        filoTypes[treeIdx][branchIdx] = FiloType.BRANCH_ONLY
-        masterNodes[treeIdx][branchIdx] = [branchIdx]
+        treeFiloTypes[branchIdx] = FiloType.BRANCH_ONLY
+        treeMasterNodes[branchIdx] = [branchIdx]
 
 
-def fillMasterChanged(masterChanged: np.ndarray, masterNodes: np.ndarray) -> None:
+def fillMasterChanged(masterChanged: np.ndarray, masterNodes: List[List[List[int]]]) -> None:
     (nTrees, nBranches) = masterChanged.shape
-    for t in range(nTrees):
-        for b in range(nBranches):
-            l1 = masterNodes[ t ][b]
-            l2 = masterNodes[t+1][b]
-            masterChanged[t, b] = len(l2) > 0 and len(set(l1) & set(l2)) == 0
+    packed = _packMasterNodes(masterNodes[:nTrees + 1], nBranches)
+    before, after = packed[:-1], packed[1:]
+
+    # Changed if there are master nodes after, but none match any of the ones before:
+    hasAfter = (after[:, :, 0] >= 0)
+    anyShared = np.any(
+        (before[:, :, :, None] == after[:, :, None, :]) & (before[:, :, :, None] >= 0),
+        axis=(2, 3)
+    )
+    masterChanged[:, :] = hasAfter & ~anyShared
+
+def _packMasterNodes(masterNodes: List[List[List[int]]], nBranches: int) -> np.ndarray:
+    """Convert lists of master nodes into a (trees, branches, width) array, padded with -1."""
+    nodeLists = [nodes for treeNodes in masterNodes for nodes in treeNodes]
+    counts = np.array([len(nodes) for nodes in nodeLists], dtype=np.int64)
+    width = max(1, int(counts.max(initial=0)))
+    packed = np.full((len(nodeLists), width), -1, dtype=np.int64)
+
+    # Scatter all nodes at once: row is which list they came from, column is index within it.
+    values = np.fromiter(itertools.chain.from_iterable(nodeLists), dtype=np.int64, count=int(counts.sum()))
+    rows = np.repeat(np.arange(len(nodeLists)), counts)
+    cols = np.arange(len(values)) - np.repeat(np.cumsum(counts) - counts, counts)
+    packed[rows, cols] = values
+    return packed.reshape((len(masterNodes), nBranches, width))
@@ -1,12 +1,11 @@
 import numpy as np
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from .addedSubtractedTransitioned import addedSubtractedTransitioned
+from .addedSubtractedTransitioned import addedSubtractedTransitionedWithLookup
 from .TDBL import TDBL
 
 from pydynamo_brain.model import Tree, Branch, FiloType
-import pydynamo_brain.util as util
 
 def motility(trees: List[Tree],
     excludeAxon: bool=True,
@@ -35,15 +34,13 @@ def motility(trees: List[Tree],
     """
 
     # print ("\n\nCalculating motility...")
-    filoTypes, added, subtracted, _, masterChangedOut, _ = \
-        addedSubtractedTransitioned(trees, excludeAxon, excludeBasal, terminalDist, filoDist)
+    # Note: this also starts a new cache of branch lengths, reused for filo lengths below.
+    filoTypes, added, subtracted, _, masterChangedOut, _, branchIDLookup = \
+        addedSubtractedTransitionedWithLookup(trees, excludeAxon, excludeBasal, terminalDist, filoDist)
 
-    # Outputs:
+    # Outputs, in the same (tree, branch) layout as the added/subtracted results:
     nTrees = len(trees)
-    branchIDList = util.sortedBranchIDList(trees)
-    nBranches = len(branchIDList)
-
-    resultShape = (nTrees, nBranches)
+    resultShape = filoTypes.shape
     filoLengths = np.full(resultShape, np.nan)
     allTDBL = np.zeros(nTrees)
 
@@ -51,68 +48,85 @@ def motility(trees: List[Tree],
     for treeIdx, tree in enumerate(trees):
         allTDBL[treeIdx] = TDBL(tree, excludeAxon, excludeBasal, includeFilo=True, filoDist=filoDist)
         if tree.rootPoint is not None:
+            axonMemo: Dict[int, bool] = {}
+            basalMemo: Dict[int, bool] = {}
             for branch in tree.rootPoint.children:
-                _calcFiloLengths(branchIDList, filoLengths[treeIdx], treeIdx, branch, excludeAxon, excludeBasal, filoDist)
+                _calcFiloLengths(
+                    branchIDLookup, filoLengths[treeIdx], treeIdx, branch,
+                    excludeAxon, excludeBasal, filoDist, axonMemo, basalMemo
+                )
 
-    # Raw motility:
+    # Raw motility, updated in place to avoid extra full-size temporaries:
     lengthBefore, lengthAfter = filoLengths[:-1, :], filoLengths[1:, :]
-    rawMotility = lengthAfter - lengthBefore
-    rawMotility[masterChangedOut] = np.nan
+    rawMotility = np.subtract(lengthAfter, lengthBefore)
+    np.putmask(rawMotility, masterChangedOut, np.nan)
 
     # including motility due to additions/subtractions
     if includeAS:
-        rawMotility[added] = lengthAfter[added]
-        rawMotility[subtracted] = -lengthBefore[subtracted]
+        np.copyto(rawMotility, lengthAfter, where=added)
+        np.negative(lengthBefore, out=rawMotility, where=subtracted)
 
-    filoLengthWithNan = np.array(filoLengths[:rawMotility.shape[0], :])
-    filoLengthWithNan[np.isnan(rawMotility)] = np.nan
+    # Filo lengths before the change, only where motility is known:
+    filoLengthWithNan = np.where(np.isnan(rawMotility), np.nan, lengthBefore)
     filoLengthSum = np.nansum(filoLengthWithNan, axis=1)
     nFilo = np.sum((filoTypes > FiloType.ABSENT) & (filoTypes < FiloType.BRANCH_ONLY), axis=1)
+    rawMotilitySum = np.nansum(rawMotility, axis=1)
 
     # Normalize by pre stats, not post:
     motilities = {
         'raw': rawMotility,
-        'rawTDBL': np.nansum(rawMotility, axis=1) / allTDBL[:-1],
-        'rawFilo': np.nansum(rawMotility, axis=1) / filoLengthSum,
-        'rawNFilo': np.nansum(rawMotility, axis=1) / nFilo[:-1]
+        'rawTDBL': _normalized(rawMotilitySum, allTDBL[:-1]),
+        'rawFilo': _normalized(rawMotilitySum, filoLengthSum),
+        'rawNFilo': _normalized(rawMotilitySum, nFilo[:-1])
     }
     return motilities, filoLengths
 
+# Divide totals by a normalizing stat, with NaN where the stat is zero (e.g. no filos).
+def _normalized(totals: np.ndarray, by: np.ndarray) -> np.ndarray:
+    return np.divide(totals, by, out=np.full(totals.shape, np.nan), where=(by != 0))
+
 
 def _calcFiloLengths(
-    branchIDList: List[str], filoLengths: np.ndarray,
-    treeIdx: int, branch: Branch,
-    excludeAxon: bool, excludeBasal: bool, filoDist: float
+    branchIDLookup: Dict[str, int], filoLengths: np.ndarray,
+    treeIdx: int, rootBranch: Branch,
+    excludeAxon: bool, excludeBasal: bool, filoDist: float,
+    axonMemo: Dict[int, bool], basalMemo: Dict[int, bool]
 ) -> None:
-    if branch.id not in branchIDList:
-        return
-
-    branchIdx = branchIDList.index(branch.id)
-    pointsWithRoot = branch.points
-    if branch.parentPoint is not None:
-        pointsWithRoot = [branch.parentPoint] + pointsWithRoot
-
-    # 1) If the branch has not been created yet, or is empty, abort
-    if branch.isEmpty():
-        filoLengths[branchIdx] = 0.0
-        return
-    # 2) If the branch contains an 'axon' label, abort. 3) Same with basal dendrite.
-    if (excludeAxon and branch.isAxon()) or (excludeBasal and branch.isBasal()):
-        filoLengths[branchIdx] = np.nan
-        return
-    # 4) If we're a filo, set and stop:
-    isFilo, branchLength = branch.isFilo(filoDist)
-    if isFilo:
-        filoLengths[branchIdx] = branchLength
-        return
-
-    # 5) Recurse to fill filolengths cache for all child branches:
-    for point in branch.points:
-        for childBranch in point.children:
-            _calcFiloLengths(branchIDList, filoLengths, treeIdx, childBranch, excludeAxon, excludeBasal, filoDist)
-
-    # 6) Add the final filo for this branch if it is there, otherwise use entire length
-    filoLengths[branchIdx] = 0
-    totalLength, totalLengthToLastBranch = branch.worldLengths()
-    lengthPastLastBranch = totalLength - totalLengthToLastBranch
-    filoLengths[branchIdx] = lengthPastLastBranch
+    # Post-order walk using an explicit stack rather than recursion, so deep trees can't
+    # hit the recursion limit. Branches are pushed with no lengths on the way down, then
+    # again with their world lengths to be finished once all their children are done.
+    toVisit: List[Tuple[Branch, Optional[Tuple[float, float]]]] = [(rootBranch, None)]
+    while len(toVisit) > 0:
+        branch, lengths = toVisit.pop()
+        if lengths is not None:
+            # 6) Add the final filo for this branch if it is there, otherwise use entire length
+            totalLength, totalLengthToLastBranch = lengths
+            lengthPastLastBranch = totalLength - totalLengthToLastBranch
+            filoLengths[branchIDLookup[branch.id]] = lengthPastLastBranch
+            continue
+
+        branchIdx = branchIDLookup.get(branch.id)
+        if branchIdx is None:
+            continue
+
+        # 1) If the branch has not been created yet, or is empty, abort
+        if branch.isEmpty():
+            filoLengths[branchIdx] = 0.0
+            continue
+        # 2) If the branch contains an 'axon' label, abort. 3) Same with basal dendrite.
+        # Labels are looked up with memos shared across the tree, so ancestors are only checked once.
+        if (excludeAxon and branch.hasPointWithAnnotation('axon', recurseUp=True, memo=axonMemo)) or \
+                (excludeBasal and branch.hasPointWithAnnotation('basal', recurseUp=True, memo=basalMemo)):
+            filoLengths[branchIdx] = np.nan
+            continue
+        # 4) If we're a filo, set and stop:
+        isFilo, branchLength = branch.isFilo(filoDist, useCachedLengths=True)
+        if isFilo:
+            filoLengths[branchIdx] = branchLength
+            continue
+
+        # 5) Finish this branch after filling filolengths for all child branches:
+        totalLength, totalLengthToLastBranch, _ = branch.cachedWorldLengths()
+        toVisit.append((branch, (totalLength, totalLengthToLastBranch)))
+        for point in reversed(branch.points):
+            toVisit.extend((childBranch, None) for childBranch in reversed(point.children))
@@ -1,4 +1,5 @@
 from collections import deque
+import numpy as np
 import os
 
 from pydynamo_brain.model import *
@@ -9,63 +10,86 @@ from pydynamo_brain.model import *
 
 # SWC file -> Tree
 def importFromSWC(path):
-    childMap, metadata, comments = {}, {}, []
-
-    swcLines = [line.rstrip('\n') for line in open(path)]
-    for line in swcLines:
-        # Process metdata values into map:
-        metaKey, metaValue = _parseMeta(line)
-        if metaKey is not None:
-            metadata[metaKey] = metaValue
-
-        # Collect comments, just in case it's useful for later:
-        if line[0] == '#':
+    metadata, comments = {}, []
+
+    # Comments and metadata are scanned separately, the numeric block is parsed in bulk below.
+    with open(path) as swcFile:
+        for line in swcFile:
+            if not line.startswith('#'):
+                continue
+            line = line.rstrip('\n')
+            # Process metdata values into map:
+            metaKey, metaValue = _parseMeta(line)
+            if metaKey is not None:
+                metadata[metaKey] = metaValue
+            # Collect comments, just in case it's useful for later:
             comments.append(line)
-            continue
 
-        # And otherwise, build the tree:
-        # n,type,x,y,z,radius,parent
-        parts = line.split(' ')
-        if len(parts) != 7:
-            print ("Unsupported SWC file format. All node lines must be n,type,x,y,z,radius,parent")
-            return None
-        nodeID, nodeType, x, y, z, radius, parent = tuple(parts)
-        x, y, z, radius = float(x), float(y), float(z), float(radius) # TODO: Scale?
-        if parent not in childMap:
-            childMap[parent] = []
-        childMap[parent].append((nodeID, (x, y, z), radius)) # TODO: Use nodeType later?
-
-    return _convertChildMapToTree(childMap)
-
-# Given mapping of parent -> list of (child ID, child XYZ), convert this to a tree model
-def _convertChildMapToTree(childMap):
-    if '-1' not in childMap or len(childMap['-1']) != 1:
+    # And otherwise, build the tree:
+    # n,type,x,y,z,radius,parent
+    try:
+        nodes = np.loadtxt(path, comments='#', dtype=np.float64, ndmin=2)
+    except ValueError:
+        nodes = None
+    if nodes is None or nodes.shape[1] != 7:
+        print ("Unsupported SWC file format. All node lines must be n,type,x,y,z,radius,parent")
+        return None
+    return _convertNodesToTree(nodes) # TODO: Use nodeType later? Scale?
+
+# Given (N, 7) array of SWC nodes, convert this to a tree model
+def _convertNodesToTree(nodes):
+    nNodes = nodes.shape[0]
+    ids = nodes[:, 0].astype(np.int64)
+    parents = nodes[:, 6].astype(np.int64)
+    somaRows = np.flatnonzero(parents == -1)
+    if len(somaRows) != 1:
         print ("Can't parse SWC file: Has more than one Soma (parent -1)")
         return None
-    somaID, somaLocation, somaRadius = childMap['-1'][0]
 
+    # Row of each node's parent, or -1 for the soma (and any node with a missing parent)
+    idOrder = np.argsort(ids, kind='stable')
+    at = np.searchsorted(ids[idOrder], parents).clip(max=nNodes - 1)
+    parentRows = np.where(ids[idOrder[at]] == parents, idOrder[at], -1)
+
+    # Children of row r are childRows[childStart[r]:childEnd[r]], kept in file order
+    childRows = np.argsort(parentRows, kind='stable')
+    childOffsets = np.cumsum(np.bincount(parentRows + 1, minlength=nNodes + 1))
+
+    # Plain lists from here, as the walk below reads single values at a time.
+    childRows = childRows.tolist()
+    childStart, childEnd = childOffsets[:-1].tolist(), childOffsets[1:].tolist()
+    pointIDs = [str(nodeID) for nodeID in ids.tolist()]
+    locations = [tuple(xyz) for xyz in nodes[:, 2:5].tolist()]
+    radii = nodes[:, 5].tolist()
+
+    somaRow = int(somaRows[0])
     tree = Tree()
-    tree.rootPoint = Point(somaID, somaLocation, somaRadius)
+    tree.rootPoint = Point(pointIDs[somaRow], locations[somaRow], radii[somaRow])
 
     # Keep track of where branches have come off that still need processing
     toProcess = deque()
-    toProcess.append(somaID)
+    toProcess.append((somaRow, tree.rootPoint))
+
+    # Number of points still to be added, kept up to date as they are added.
+    # Progress is only reported every thousand or so points, rather than every branch.
+    nLeft = nNodes
+    nextReport = nLeft
 
     branchCounter = 0
     while len(toProcess) > 0:
-        nextParentID = toProcess.popleft()
-        nLeft = sum([len(childMap[k]) for k in childMap])
-        print ("%d remain, Processing %s " % (nLeft, nextParentID))
-        if nextParentID not in childMap or len(childMap[nextParentID]) == 0:
+        parentRow, parentPoint = toProcess.popleft()
+        if nLeft <= nextReport:
+            print ("%d remain, Processing %s " % (nLeft, parentPoint.id))
+            nextReport = nLeft - 1000
+        if childStart[parentRow] == childEnd[parentRow]:
             continue
-        parentPoint = tree.getPointByID(nextParentID)
-        assert parentPoint is not None
 
         # Start this branch, but remember parent if it has more coming off...
-        branchPointID, branchPointLocation, branchPointRadius = childMap[nextParentID][0]
-        childMap[nextParentID].pop(0)
-        if len(childMap[nextParentID]) > 0:
-            toProcess.append(nextParentID)
+        branchRow = childRows[childStart[parentRow]]
+        childStart[parentRow] += 1
+        nLeft -= 1
+        if childStart[parentRow] < childEnd[parentRow]:
+            toProcess.append((parentRow, parentPoint))
 
         newBranch = Branch('%04x' % branchCounter)
         newBranch.setParentPoint(parentPoint)
@@ -73,15 +97,17 @@ def _convertChildMapToTree(childMap):
 
         while True:
             # Walk along the branch, adding points as we go
-            newBranch.addPoint(Point(branchPointID, branchPointLocation, branchPointRadius))
-            oldBranchPointID = branchPointID
-            if branchPointID not in childMap or len(childMap[branchPointID]) == 0:
+            branchPoint = Point(pointIDs[branchRow], locations[branchRow], radii[branchRow])
+            newBranch.addPoint(branchPoint)
+            oldBranchRow = branchRow
+            if childStart[oldBranchRow] == childEnd[oldBranchRow]:
                 break
             # Remember any intermediate points that have more children coming off them
-            branchPointID, branchPointLocation, branchPointRadius = childMap[oldBranchPointID][0]
-            childMap[oldBranchPointID].pop(0)
-            if len(childMap[oldBranchPointID]) > 0:
-                toProcess.append(oldBranchPointID)
+            branchRow = childRows[childStart[oldBranchRow]]
+            childStart[oldBranchRow] += 1
+            nLeft -= 1
+            if childStart[oldBranchRow] < childEnd[oldBranchRow]:
+                toProcess.append((oldBranchRow, branchPoint))
         tree.addBranch(newBranch)
     # Done!
     return tree
@@ -6,7 +6,7 @@ from __future__ import annotations
 import attr
 import numpy as np
 
-from typing import Any, List, Optional, Tuple, TYPE_CHECKING
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 import pydynamo_brain.util as util
 from pydynamo_brain.util import SAVE_META
@@ -41,9 +41,29 @@ class Branch():
     reparentTo: Optional[Point] = attr.ib(default=None, metadata=SAVE_META)
     """HACK - document"""
 
+    _worldLengthCache: Optional[Tuple[int, float, float, List[float]]] = \
+        attr.ib(default=None, repr=False, eq=False, order=False)
+    """(epoch, totalLength, totalLengthToLastBranch, cumulativeLengths) from cachedWorldLengths."""
+
+    _lastChildPointCache: Optional[Tuple[int, int]] = attr.ib(default=None, repr=False, eq=False, order=False)
+    """(epoch, index) from cachedLastPointWithChildrenIdx."""
+
+    _indexInParent: int = attr.ib(default=-1, repr=False, eq=False, order=False)
+    """Last known index within the parent tree, checked before use."""
+
     def indexInParent(self) -> int:
         """Ordinal number of branch within the tree it is owned by."""
-        return self._parentTree.branches.index(self)
+        branches = self._parentTree.branches
+        idx = self._indexInParent
+        if 0 <= idx < len(branches) and branches[idx] is self:
+            return idx
+        # Most likely an earlier branch was removed, otherwise search:
+        if 0 < idx <= len(branches) and branches[idx - 1] is self:
+            idx = idx - 1
+        else:
+            idx = branches.index(self)
+        self._indexInParent = idx
+        return idx
 
     def indexForPointID(self, pointID: str) -> int:
         """Given a point ID, return how far along the branch it sits."""
@@ -54,29 +74,45 @@ class Branch():
 
     def indexForPoint(self, pointTarget: Point) -> int:
         """Given a point, return how far along the branch it sits."""
-        return self.indexForPointID(pointTarget.id)
+        idx = pointTarget._indexInBranch
+        if 0 <= idx < len(self.points) and self.points[idx] is pointTarget:
+            return idx
+        idx = self.indexForPointID(pointTarget.id)
+        if idx >= 0 and self.points[idx] is pointTarget:
+            pointTarget._indexInBranch = idx
+        return idx
 
     def isEmpty(self) -> bool:
         """Whether the branch has no points other than the branch point."""
         return len(self.points) == 0
 
-    def hasPointWithAnnotation(self, annotation: str, recurseUp:bool=False) -> bool:
-        """Whether any point directly on this branch has a given annotation."""
-        pointsWithParent = self.pointsWithParentIfExists()
-        if util.lastPointWithLabelIdx(pointsWithParent, annotation) >= 0:
-            return True
+    def hasPointWithAnnotation(self, annotation: str, recurseUp:bool=False,
+        memo: Optional[Dict[int, bool]]=None
+    ) -> bool:
+        """Whether any point directly on this branch has a given annotation.
+        If given, memo keeps the result for each branch checked, so repeated checks of branches with
+        shared ancestors are cheap. Only share a memo between calls with the same arguments."""
+        if memo is not None and id(self) in memo:
+            return memo[id(self)]
 
+        result = False
+        pointsWithParent = self.pointsWithParentIfExists()
+        if util.hasPointWithLabel(pointsWithParent, annotation):
+            result = True
         # Optionally go upwards, e.g. you're an axon branch if you come off the main axon.
-        if recurseUp and self.parentPoint is not None and self.parentPoint.parentBranch is not None:
+        elif recurseUp and self.parentPoint is not None and self.parentPoint.parentBranch is not None:
             if self.parentPoint.parentBranch == self:
                 # Hmm... not sure how this happened?
-                return False
-            # NOTE: this will also apply even if the parent's point is after
-            # the point I have branched off at. This could be edited if needed,
-            # to only match if I'm after the annotation.
-            return self.parentPoint.parentBranch.hasPointWithAnnotation(annotation, recurseUp)
-        else:
-            return False
+                result = False
+            else:
+                # NOTE: this will also apply even if the parent's point is after
+                # the point I have branched off at. This could be edited if needed,
+                # to only match if I'm after the annotation.
+                result = self.parentPoint.parentBranch.hasPointWithAnnotation(annotation, recurseUp, memo)
+
+        if memo is not None:
+            memo[id(self)] = result
+        return result
 
     def isAxon(self, axonLabel: str='axon', recurseUp: bool=True) -> bool:
         """Whether the branch is labelled as the axon."""
@@ -89,17 +125,22 @@ class Branch():
         """True if any point on the branch has child branches coming off it."""
         return _lastPointWithChildren(self.points) > -1
 
-    def isFilo(self, maxLength: float) -> Tuple[bool, float]:
+    def isFilo(self, maxLength: float, useCachedLengths: bool=False) -> Tuple[bool, float]:
         """A branch is considered a Filo if it has no children, not a lamella, and not too long.
 
+        :param useCachedLengths: Use values cached for this analysis pass (see cachedWorldLengths).
         :returns: Tuple pair (whether it is a Filo, total length of the branch)"""
         # If it has children, it's not a filo
-        if self.hasChildren():
+        hasChildren = self.cachedLastPointWithChildrenIdx() > -1 if useCachedLengths else self.hasChildren()
+        if hasChildren:
             return False, 0
         # If it has a lamella, it's not a filo
-        if _lastPointWithLabel(self.points, 'lam') > -1:
+        if util.hasPointWithLabel(self.points, 'lam'):
             return False, 0
-        totalLength, _ = self.worldLengths()
+        if useCachedLengths:
+            totalLength, _, _ = self.cachedWorldLengths()
+        else:
+            totalLength, _ = self.worldLengths()
         return totalLength < maxLength, totalLength
 
     def getOrder(self, centrifugal: bool=False) -> int:
@@ -134,6 +175,9 @@ class Branch():
         :returns: the index of the new point."""
         self.points.append(point)
         point.parentBranch = self
+        point._indexInBranch = len(self.points) - 1
+        if self._parentTree is not None:
+            self._parentTree._indexPoint(point)
         return len(self.points) - 1
 
     def insertPointBefore(self, point: Point, index: int) -> int:
@@ -142,6 +186,9 @@ class Branch():
         :returns: the index of the new point."""
         self.points.insert(index, point)
         point.parentBranch = self
+        point._indexInBranch = index
+        if self._parentTree is not None:
+            self._parentTree._indexPoint(point)
         return index
 
     def removePointLocally(self, point: Point) -> Optional[Point]:
@@ -153,6 +200,8 @@ class Branch():
             return None
         index = self.points.index(point)
         self.points.remove(point)
+        if self._parentTree is not None:
+            self._parentTree._unindexPoint(point)
         return self.parentPoint if index == 0 else self.points[index - 1]
 
     def setParentPoint(self, parentPoint: Point) -> None:
@@ -180,19 +229,8 @@ class Branch():
 
         :returns: (totalLength, totalLength to last branch)
         """
-        pointsWithRoot = self.pointsWithParentIfExists()[fromIdx:]
-        parentRadius = 0
-        if pointsWithRoot[0].isRoot() == False:
-            parentRadius = pointsWithRoot[0].returnWorldRadius(self._parentTree._fullState())
-        x, y, z = self._parentTree.worldCoordPoints(pointsWithRoot)
-        lastBranchPoint = _lastPointWithChildren(pointsWithRoot)
-        totalLength, totalLengthToLastBranch = 0.0, 0.0
-        for i in range(len(x) - 1):
-            edgeDistance = util.deltaSz((x[i], y[i], z[i]), (x[i+1], y[i+1], z[i+1]))
-            totalLength += edgeDistance
-            if i < lastBranchPoint:
-                totalLengthToLastBranch += edgeDistance
-        totalLength = totalLength-parentRadius
+        totalLength, totalLengthToLastBranch, _ = \
+            self._worldLengthsFor(self.pointsWithParentIfExists()[fromIdx:])
         return totalLength, totalLengthToLastBranch
 
     def cumulativeWorldLengths(self) -> List[float]:
@@ -200,13 +238,63 @@ class Branch():
 
         :returns: List of cumulative lengths, how far along the branch to get to each point."""
         pointsWithRoot = self.pointsWithParentIfExists()
-        x, y, z = self._parentTree.worldCoordPoints(pointsWithRoot)
-        cumulativeLength, lengths = 0.0, []
-        for i in range(len(x) - 1):
-            edgeDistance = util.deltaSz((x[i], y[i], z[i]), (x[i+1], y[i+1], z[i+1]))
-            cumulativeLength += edgeDistance
-            lengths.append(cumulativeLength)
-        return lengths
+        return _cumulativeEdgeLengths(self._parentTree.worldCoordArray(pointsWithRoot)).tolist()
+
+    def cachedWorldLengths(self) -> Tuple[float, float, List[float]]:
+        """Both worldLengths() and cumulativeWorldLengths(), reused until the parent tree's
+        cached lengths are invalidated. Edits don't invalidate these, so only use this
+        within a pass that started with Tree.invalidateCachedLengths().
+
+        :returns: (totalLength, totalLength to last branch, cumulative lengths)
+        """
+        epoch = self._parentTree._lengthCacheEpoch
+        cache = self._worldLengthCache
+        if cache is None or cache[0] != epoch:
+            pointsWithRoot = self.pointsWithParentIfExists()
+            # Reuse lengths from an identical branch elsewhere (e.g. another timepoint) if shared:
+            sharedLengths = self._parentTree._sharedLengths
+            geometryKey = () if sharedLengths is None else self._geometryKey(pointsWithRoot)
+            lengths = None if sharedLengths is None else sharedLengths.get(geometryKey)
+            if lengths is None:
+                totalLength, totalLengthToLastBranch, cumulativeArray = self._worldLengthsFor(pointsWithRoot)
+                lengths = (totalLength, totalLengthToLastBranch, cumulativeArray.tolist())
+                if sharedLengths is not None:
+                    sharedLengths[geometryKey] = lengths
+            cache = (epoch, lengths[0], lengths[1], lengths[2])
+            self._worldLengthCache = cache
+        _, totalLength, totalLengthToLastBranch, cumulativeLengths = cache
+        return totalLength, totalLengthToLastBranch, cumulativeLengths
+
+    def cachedLastPointWithChildrenIdx(self) -> int:
+        """Index of the last point with child branches (-1 if none), reused in the same way
+        as cachedWorldLengths until the parent tree's cache is invalidated."""
+        epoch = self._parentTree._lengthCacheEpoch
+        if self._lastChildPointCache is None or self._lastChildPointCache[0] != epoch:
+            self._lastChildPointCache = (epoch, _lastPointWithChildren(self.points))
+        return self._lastChildPointCache[1]
+
+    def _geometryKey(self, pointsWithRoot: List[Point]) -> Tuple[Any, ...]:
+        """Everything the world lengths depend on, so branches with equal keys have equal lengths."""
+        firstPoint = pointsWithRoot[0]
+        return (
+            self.id,
+            tuple(self._parentTree._fullState().projectOptions.pixelSizes),
+            None if firstPoint.isRoot() else firstPoint.radius,
+            tuple(tuple(p.location) for p in pointsWithRoot),
+            tuple(len(p.children) > 0 for p in pointsWithRoot),
+        )
+
+    def _worldLengthsFor(self, pointsWithRoot: List[Point]) -> Tuple[float, float, np.ndarray]:
+        """Total length, length to last branch point, and cumulative lengths along points."""
+        parentRadius = 0
+        if pointsWithRoot[0].isRoot() == False:
+            parentRadius = pointsWithRoot[0].returnWorldRadius(self._parentTree._fullState())
+        cumulativeLengths = _cumulativeEdgeLengths(self._parentTree.worldCoordArray(pointsWithRoot))
+        lastBranchPoint = _lastPointWithChildren(pointsWithRoot)
+        totalLength = float(cumulativeLengths[-1]) if len(cumulativeLengths) > 0 else 0.0
+        totalLengthToLastBranch = \
+            float(cumulativeLengths[lastBranchPoint - 1]) if lastBranchPoint > 0 else 0.0
+        return totalLength - parentRadius, totalLengthToLastBranch, cumulativeLengths
 
     def pointsWithParentIfExists(self) -> List[Point]:
         if self.parentPoint is not None:
@@ -217,17 +305,12 @@ class Branch():
 
 # Return the index of the last point with child branches, or -1 if not found.
 def _lastPointWithChildren(points: List[Point]) -> int:
-    lastPointIdx = -1
-    for i, point in enumerate(points):
-        if len(point.children) > 0:
-            lastPointIdx = i
-    return lastPointIdx
-
-# Return the index of the last point whose label contains given text, or -1 if not found.
-# TODO - move somewhere common.
-def _lastPointWithLabel(points: List[Point], label: str) -> int:
-    lastPointIdx = -1
-    for i, point in enumerate(points):
-        if point.annotation.find(label) != -1:
-            lastPointIdx = i
-    return lastPointIdx
+    for i in range(len(points) - 1, -1, -1):
+        if len(points[i].children) > 0:
+            return i
+    return -1
+
+# Return the running total of distances between consecutive rows of an (N, 3) location array.
+def _cumulativeEdgeLengths(locations: np.ndarray) -> np.ndarray:
+    deltas = np.diff(locations, axis=0)
+    return np.cumsum(np.sqrt(np.einsum('ij,ij->i', deltas, deltas)))
@@ -43,6 +43,9 @@ class Point():
     hilighted: Optional[bool] = attr.ib(default=None, eq=False, order=False, metadata=SAVE_META)
     """ NOTE: Hilighting has been removed, keep here for backwards compatibility."""
 
+    _indexInBranch: int = attr.ib(default=-1, repr=False, eq=False, order=False)
+    """Last known index within the parent branch, checked before use."""
+
     def isRoot(self) -> bool:
         """Whether this point represents the root of the whole tree."""
         return self.parentBranch is None
@@ -11,7 +11,7 @@ from typing import List
 import pydynamo_brain.util as util
 from pydynamo_brain.util import SAVE_META, Point3D
 
-from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
 from .branch import Branch
 from .point import Point
@@ -36,12 +36,28 @@ class Tree():
     _parentState: Optional[UIState] = attr.ib(default=None, repr=False, eq=False, order=False)
     """UI State this belongs to."""
 
-    # HACK - make faster, index points by ID
+    _pointByID: Dict[str, Point] = attr.ib(default=attr.Factory(dict), repr=False, eq=False, order=False)
+    """Lookup of point ID to point, rebuilt whenever an ID can't be found."""
+
+    _lengthCacheEpoch: int = attr.ib(default=0, repr=False, eq=False, order=False)
+    """Version of cached branch lengths, see invalidateCachedLengths."""
+
+    _sharedLengths: Optional[Dict[Tuple[Any, ...], Tuple[float, float, List[float]]]] = \
+        attr.ib(default=None, repr=False, eq=False, order=False)
+    """Branch lengths by geometry, shared with other trees while set, see shareCachedLengths."""
+
     def getPointByID(self, pointID: str, includeDisconnected: bool=False) -> Optional[Point]:
         """Given the ID of a point, find the point object that matches."""
-        for point in self.flattenPoints(includeDisconnected):
-            if point.id == pointID:
-                return point
+        point = self._pointByID.get(pointID)
+        if point is None or point.id != pointID:
+            # Missing or renamed, so the index may be out of date:
+            point = self._reindexPoints().get(pointID)
+        if point is None or includeDisconnected or self._isConnected(point):
+            return point
+        # Not reachable by walking up, but a connected point may share its ID, so search down as before:
+        for connected in self.flattenPoints():
+            if connected.id == pointID:
+                return connected
         return None
 
     def getBranchByID(self, branchID: str) -> Optional[Branch]:
@@ -51,17 +67,34 @@ class Tree():
                 return branch
         return None
 
+    def invalidateCachedLengths(self) -> None:
+        """Mark all cached branch lengths as stale, e.g. at the start of an analysis pass.
+
+        Edits to points don't invalidate the cache, so this must be called before
+        relying on Branch.cachedWorldLengths."""
+        self._lengthCacheEpoch += 1
+
+    def shareCachedLengths(self, sharedLengths: Optional[Dict[Tuple[Any, ...], Tuple[float, float, List[float]]]]) -> None:
+        """While set, branches calculating cached lengths first look for a branch with identical
+        geometry in sharedLengths (e.g. the same branch at another timepoint), and add their
+        own results otherwise. Pass None to stop sharing."""
+        self._sharedLengths = sharedLengths
+
     def addBranch(self, branch: Branch) -> int:
         """Adds a branch to the tree.
 
         :returns: Index of branch within the tree."""
         self.branches.append(branch)
         branch._parentTree = self
+        branch._indexInParent = len(self.branches) - 1
+        for point in branch.points:
+            self._indexPoint(point)
         return len(self.branches) - 1
 
     def removeBranch(self, branch: Branch) -> None:
         """Removes a branch from the tree - assumes all points already removed."""
-        if branch not in self.branches:
+        branchIdx = self._indexOfBranch(branch)
+        if branchIdx < 0:
             print ("Deleting branch not in the tree? Whoops")
             return
         if len(branch.points) > 0:
@@ -69,7 +102,19 @@ class Tree():
             return
         if branch.parentPoint is not None:
             branch.parentPoint.removeChildrenByID(branch.id)
-        self.branches.remove(branch)
+        del self.branches[branchIdx]
+
+    def _indexOfBranch(self, branch: Branch) -> int:
+        """Index of this exact branch object within the tree, or -1 if it's not in the tree."""
+        if branch._parentTree is self:
+            branchIdx = branch._indexInParent
+            if 0 <= branchIdx < len(self.branches) and self.branches[branchIdx] is branch:
+                return branchIdx
+        for branchIdx, treeBranch in enumerate(self.branches):
+            if treeBranch is branch:
+                branch._indexInParent = branchIdx
+                return branchIdx
+        return -1
 
     def removePointByID(self, pointID: str) -> Optional[Point]:
         """Removes a single point from the tree, identified by ID."""
@@ -78,6 +123,7 @@ class Tree():
             if pointToRemove.parentBranch is None:
                 assert self.rootPoint is not None and pointToRemove.id == self.rootPoint.id
                 if len(self.branches) == 0:
+                    self._unindexPoint(pointToRemove)
                     self.rootPoint = None
                 else:
                     print ("You can't remove the soma if other points exist - please remove those first!")
@@ -138,7 +184,7 @@ class Tree():
         assert pointToMove is not None, "Trying to move an unknown point ID"
         delta = util.locationMinus(newLocation, pointToMove.location)
         if downstream:
-            self._recursiveMovePointDelta(pointToMove, delta)
+            self._movePointDeltaDownstream(pointToMove, delta)
         else:
             # Non-recursive, so just move this one point:
             pointToMove.location = newLocation
@@ -298,7 +344,10 @@ class Tree():
         """
         emptyBranches = [b for b in self.branches if len(b.points) == 0]
         for emptyBranch in emptyBranches:
-            self.removeBranch(emptyBranch)
+            if emptyBranch.parentPoint is not None:
+                emptyBranch.parentPoint.removeChildrenByID(emptyBranch.id)
+        # Remove all at once, rather than searching and shifting the list once per branch:
+        self.branches[:] = [b for b in self.branches if len(b.points) > 0]
         return len(emptyBranches)
 
     def spatialRadius(self) -> float:
@@ -320,50 +369,37 @@ class Tree():
         :param targetLocation: (x, y, z) location tuple.
         :param zFilter: If true, only items on the same zStack are considered.
         :returns: Point object of point closest to the target location."""
-        closestDist, closestPoint = None, None
-        for point in self.flattenPoints():
-            if zFilter and round(point.location[2]) != round(targetLocation[2]):
-                continue
-            dist = util.deltaSz(targetLocation, point.location)
-            if closestDist is None or dist < closestDist:
-                closestDist, closestPoint = dist, point
-        return closestPoint
+        allPoints = self.flattenPoints()
+        if zFilter:
+            targetZ = round(targetLocation[2])
+            allPoints = [p for p in allPoints if round(p.location[2]) == targetZ]
+        if len(allPoints) == 0:
+            return None
+        allLocations = np.array([p.location for p in allPoints], dtype=np.float64)
+        return allPoints[_closestIdx(allLocations, targetLocation)]
 
     def closestPointToWorldLocation(self, targetWorldLocation: Point3D) -> Optional[Point]:
         """Given a position in world space, find the point closest to it in world space.
 
         :param targetWorldLocation: (x, y, z) location tuple.
         :returns: Point object of point closest to the target location."""
-        closestDist, closestPoint = None, None
         allPoints = self.flattenPoints()
-        allX, allY, allZ = self.worldCoordPoints(allPoints)
-        for point, loc in zip(allPoints, zip(allX, allY, allZ)):
-            dist = util.deltaSz(targetWorldLocation, loc)
-            if closestDist is None or dist < closestDist:
-                closestDist, closestPoint = dist, point
-        return closestPoint
+        if len(allPoints) == 0:
+            return None
+        return allPoints[_closestIdx(self.worldCoordArray(allPoints), targetWorldLocation)]
 
     def worldCoordPoints(self, points: List[Point]) -> Tuple[List[float], List[float], List[float]]:
         """Convert image pixel (x, y, z) to a real-world (x, y, z) position."""
-        x: List[float] = []
-        y: List[float] = []
-        z: List[float] = []
+        worldLocations = self.worldCoordArray(points)
+        return worldLocations[:, 0].tolist(), worldLocations[:, 1].tolist(), worldLocations[:, 2].tolist()
 
+    def worldCoordArray(self, points: List[Point]) -> np.ndarray:
+        """Convert image pixel locations of points to real-world positions, as an (N, 3) array."""
         globalScale = self._fullState().projectOptions.pixelSizes
-        for p in points:
-            # POIUY: support calling with list of locations?
-            #pAt = p
-            #if hasattr(p, 'location'):
-            pAt = p.location
-
-            # Note: For now, tree-specific transforms are unsupported!
-            #pAt = np.matmul(np.array(self.transform.rotation), np.array(pAt).T).T
-            #pAt = (pAt + np.array(self.transform.translation)) * np.array(self.transform.scale)
-            pAt = np.array(pAt) * globalScale
-            x.append(pAt[0])
-            y.append(pAt[1])
-            z.append(pAt[2])
-        return x, y, z
+        # Note: For now, tree-specific transforms are unsupported!
+        #locations = (locations @ np.array(self.transform.rotation).T + self.transform.translation) * self.transform.scale
+        locations = np.array([p.location for p in points], dtype=np.float64).reshape((-1, 3))
+        return locations * np.array(globalScale, dtype=np.float64)
 
     def spatialDist(self, p1: Point, p2: Point) -> float:
         """Given two points in the tree, return the 3D spatial distance"""
@@ -393,25 +429,36 @@ class Tree():
             treeDist += util.deltaSz(pA, pB)
         return self.spatialDist(p1, p2), treeDist
 
-    def _recursiveMovePointDelta(self, point: Point, delta: Point3D) -> None:
-        """Recursively move a point, plus all its children and later neighbours."""
-        point.location = util.locationPlus(point.location, delta)
-        # First, move any branches coming off this point, by moving their first point
+    def _movePointDeltaDownstream(self, point: Point, delta: Point3D) -> None:
+        """Move a point, plus all its children and later neighbours."""
+        # Branches coming off each point, keyed by the parent point's ID:
+        childBranches: Dict[str, List[Branch]] = {}
         for branch in self.branches:
-            if branch.parentPoint is not None and branch.parentPoint.id == point.id and len(branch.points) > 0:
-                self._recursiveMovePointDelta(branch.points[0], delta)
-        # Next, move the next point on this branch (which will recursively do likewise...)
-        if point.parentBranch is not None:
-            nextIdx = point.parentBranch.indexForPoint(point) + 1
-            assert nextIdx > 0, "Moving a point on a branch that doesn't know the point is there?"
-            if nextIdx < len(point.parentBranch.points):
-                self._recursiveMovePointDelta(point.parentBranch.points[nextIdx], delta)
+            if branch.parentPoint is not None and len(branch.points) > 0:
+                childBranches.setdefault(branch.parentPoint.id, []).append(branch)
+
+        # Walk with an explicit stack of points to start moving from, rather than recursing.
+        toMove = [point]
+        while len(toMove) > 0:
+            pointAt = toMove.pop()
+            pointsAlong = [pointAt]
+            if pointAt.parentBranch is not None:
+                atIdx = pointAt.parentBranch.indexForPoint(pointAt)
+                assert atIdx >= 0, "Moving a point on a branch that doesn't know the point is there?"
+                pointsAlong = pointAt.parentBranch.points[atIdx:]
+            # Move the rest of this branch, remembering any branches coming off it.
+            for pointAlong in pointsAlong:
+                pointAlong.location = util.locationPlus(pointAlong.location, delta)
+                for branch in childBranches.get(pointAlong.id, []):
+                    toMove.append(branch.points[0])
 
     def clearAndCopyFrom(self, otherTree: Tree, idMaker: FullState) -> None:
         pointMap: Dict[str, Point] = {}
         assert otherTree.rootPoint is not None, "Can't clone empty tree."
 
+        self._pointByID = {}
         self.rootPoint = _clonePoint(otherTree.rootPoint, idMaker, pointMap)
+        self._indexPoint(self.rootPoint)
 
         nonEmptyBranches = [branch for branch in otherTree.branches if len(branch.points) > 0]
         for branch in nonEmptyBranches:
@@ -429,6 +476,43 @@ class Tree():
                 else:
                     newBranch.reparentTo = pointMap[oldBranch.reparentTo.id]
 
+    def _indexPoint(self, point: Point) -> None:
+        """Register a point as being in the tree, for lookup by ID.
+        Keeps any point already found for the ID, so the first one wins as in _reindexPoints."""
+        self._pointByID.setdefault(point.id, point)
+
+    def _unindexPoint(self, point: Point) -> None:
+        """Stop finding a point by ID, if it has been removed from the tree."""
+        if self._pointByID.get(point.id) is point:
+            del self._pointByID[point.id]
+
+    def _reindexPoints(self) -> Dict[str, Point]:
+        """Rebuild the ID lookup from scratch, using all points including disconnected ones."""
+        self._pointByID = {}
+        # Reversed, so the first point with a given ID wins, same as a linear scan.
+        for point in reversed(self.flattenPoints(includeDisconnected=True)):
+            self._pointByID[point.id] = point
+        return self._pointByID
+
+    def _isConnected(self, point: Point) -> bool:
+        """Whether a point can be reached by walking down the tree from the root, as flattenPoints does."""
+        seenBranches = set()
+        while point.parentBranch is not None:
+            branch = point.parentBranch
+            # Removed points keep their parentBranch, so check it still holds them.
+            idx = branch.indexForPoint(point)
+            if idx < 0 or branch.points[idx] is not point:
+                return False
+            # Branches moved in matlab are found via reparentTo, their parentPoint is a stale copy.
+            parent = branch.reparentTo or branch.parentPoint
+            if parent is None or id(branch) in seenBranches:
+                return False
+            if not any(child is branch for child in parent.children):
+                return False
+            seenBranches.add(id(branch))
+            point = parent
+        return point is self.rootPoint
+
     def _fullState(self) -> FullState:
         """
         Utility to return the non-none fullstate object.
@@ -439,6 +523,12 @@ class Tree():
 
 
 
+# Index of the row in an (N, 3) array of locations closest to the target.
+def _closestIdx(locations: np.ndarray, targetLocation: Point3D) -> int:
+    delta: np.ndarray = locations - np.array(targetLocation, dtype=np.float64)
+    return int(np.argmin(np.einsum('ij,ij->i', delta, delta)))
+
+
 ### Cloning utilities
 
 def _clonePoint(point: Point, idMaker: FullState, pointMap: Dict[str, Point]) -> Point:
@@ -61,8 +61,191 @@ def testBranchOrder():
     assert centrifugalOrders[2] == 2
     assert centrifugalOrders[3] == 3
 
+def testPointByID():
+    tree = Tree()
+    pR = Point(id='root', location=(0,0,0))
+    tree.rootPoint = pR
+    p1 = Point(id='p1', location=(0,0,1))
+    p2 = Point(id='p2', location=(0,0,2))
+    p3 = Point(id='p3', location=(0,1,1))
+
+    b0 = Branch(id='b0')
+    b0.setParentPoint(pR)
+    b0.addPoint(p1)
+    tree.addBranch(b0)
+    b0.addPoint(p2)
+
+    assert tree.getPointByID('root') is pR
+    assert tree.getPointByID('p1') is p1
+    assert tree.getPointByID('p2') is p2
+    assert tree.getPointByID('p3') is None
+
+    # Disconnected branches only found if requested:
+    b1 = Branch(id='b1')
+    b1.addPoint(p3)
+    tree.addBranch(b1)
+    assert tree.getPointByID('p3') is None
+    assert tree.getPointByID('p3', includeDisconnected=True) is p3
+    b1.setParentPoint(p1)
+    assert tree.getPointByID('p3') is p3
+
+    # Removed and renamed points:
+    tree.removePointByID('p2')
+    assert tree.getPointByID('p2') is None
+    p1.id = 'p1renamed'
+    assert tree.getPointByID('p1') is None
+    assert tree.getPointByID('p1renamed') is p1
+
+def testMovePointDownstream():
+    """
+    pR -- p1 -- p2 -- p3
+                 \
+                  p4 -- p5
+    """
+    tree = Tree()
+    pR = Point(id='root', location=(0,0,0))
+    tree.rootPoint = pR
+    p1 = Point(id='p1', location=(1,0,0))
+    p2 = Point(id='p2', location=(2,0,0))
+    p3 = Point(id='p3', location=(3,0,0))
+    p4 = Point(id='p4', location=(2,1,0))
+    p5 = Point(id='p5', location=(2,2,0))
+
+    b0 = Branch(id='b0')
+    b0.setParentPoint(pR)
+    for p in [p1, p2, p3]:
+        b0.addPoint(p)
+    b1 = Branch(id='b1')
+    b1.setParentPoint(p2)
+    for p in [p4, p5]:
+        b1.addPoint(p)
+    tree.addBranch(b0)
+    tree.addBranch(b1)
+
+    tree.movePoint('p2', (2,0,5), downstream=True)
+    assert pR.location == (0,0,0)
+    assert p1.location == (1,0,0)
+    assert p2.location == (2,0,5)
+    assert p3.location == (3,0,5)
+    assert p4.location == (2,1,5)
+    assert p5.location == (2,2,5)
+
+    tree.movePoint('p4', (2,1,0))
+    assert p4.location == (2,1,0)
+    assert p5.location == (2,2,5)
+
+def testIndexAfterEdits():
+    tree = Tree()
+    pR = Point(id='root', location=(0,0,0))
+    tree.rootPoint = pR
+    p1 = Point(id='p1', location=(0,0,1))
+    p2 = Point(id='p2', location=(0,0,2))
+    p3 = Point(id='p3', location=(0,0,3))
+
+    b0 = Branch(id='b0')
+    b0.setParentPoint(pR)
+    b0.addPoint(p1)
+    b0.addPoint(p3)
+    tree.addBranch(b0)
+    b1 = Branch(id='b1')
+    b1.setParentPoint(p1)
+    tree.addBranch(b1)
+    assert p3.indexInParent() == 1
+    assert b1.indexInParent() == 1
+
+    # Cached indexes must follow inserts and removals:
+    b0.insertPointBefore(p2, 1)
+    assert p2.indexInParent() == 1
+    assert p3.indexInParent() == 2
+    b0.removePointLocally(p1)
+    assert p3.indexInParent() == 1
+    b0.removePointLocally(p2)
+    b0.removePointLocally(p3)
+    tree.removeBranch(b0)
+    assert b1.indexInParent() == 0
+
+def testPointByIDReparented():
+    tree = Tree()
+    pR = Point(id='root', location=(0,0,0))
+    tree.rootPoint = pR
+    p1 = Point(id='p1', location=(0,0,1))
+    p2 = Point(id='p2', location=(0,0,2))
+    p3 = Point(id='p3', location=(0,0,3))
+
+    b0 = Branch(id='b0')
+    b0.setParentPoint(pR)
+    b0.addPoint(p1)
+    b0.addPoint(p2)
+    tree.addBranch(b0)
+
+    # As loaded from file: attached to p1 via reparentTo, parentPoint is a stale copy.
+    b1 = Branch(id='b1')
+    b1.parentPoint = Point(id='p2', location=(0,0,2))
+    b1.reparentTo = p1
+    p1.children.append(b1)
+    b1.addPoint(p3)
+    tree.addBranch(b1)
+
+    assert p3 in tree.flattenPoints()
+    assert tree.getPointByID('p3') is p3
+    assert tree.getPointByID('p2') is p2
+
+    # Detached branches are only found when asked for:
+    p4 = Point(id='p4', location=(0,0,4))
+    b2 = Branch(id='b2')
+    b2.parentPoint = p2
+    b2.addPoint(p4)
+    tree.addBranch(b2)
+    assert tree.getPointByID('p4') is None
+    assert tree.getPointByID('p4', includeDisconnected=True) is p4
+
+    # Duplicate IDs give the first one found:
+    p5 = Point(id='p3', location=(0,0,5))
+    b1.addPoint(p5)
+    assert tree.getPointByID('p3') is p3
+
+    # Branches left hanging off a deleted point are no longer connected:
+    p6 = Point(id='p6', location=(0,0,6))
+    b3 = Branch(id='b3')
+    b3.setParentPoint(p2)
+    b3.addPoint(p6)
+    tree.addBranch(b3)
+    assert tree.getPointByID('p6') is p6
+    tree.removePointByID('p2')
+    assert p6 not in tree.flattenPoints()
+    assert tree.getPointByID('p6') is None
+    assert tree.getPointByID('p6', includeDisconnected=True) is p6
+
+def testClosestPointTo():
+    tree = Tree()
+    pR = Point(id='root', location=(0,0,0))
+    tree.rootPoint = pR
+    p1 = Point(id='p1', location=(1,0,0))
+    p2 = Point(id='p2', location=(2,0,0))
+    p3 = Point(id='p3', location=(1,1,0))
+
+    b0 = Branch(id='b0')
+    b0.setParentPoint(pR)
+    b0.addPoint(p1)
+    b0.addPoint(p2)
+    tree.addBranch(b0)
+    b1 = Branch(id='b1')
+    b1.setParentPoint(p1)
+    b1.addPoint(p3)
+    tree.addBranch(b1)
+
+    assert tree.closestPointTo((1.2, 0.9, 0)) is p3
+    assert tree.closestPointTo((1.9, 0.1, 0.4)) is p2
+    assert tree.closestPointTo((1.2, 0.9, 0.6), zFilter=True) is None
+    assert tree.closestPointTo((1.9, 0.1, 0.4), zFilter=True) is p2
+
 def run():
     testBranchOrder()
+    testPointByID()
+    testMovePointDownstream()
+    testIndexAfterEdits()
+    testPointByIDReparented()
+    testClosestPointTo()
     return True
 
 if __name__ == '__main__':
@@ -1,13 +1,16 @@
 import numpy as np
+import os
 import scipy.io
 import tempfile
 
 from pydynamo_brain.analysis import addedSubtractedTransitioned, motility, TDBL
-from pydynamo_brain.util import emptyArrayMatrix
+from pydynamo_brain.util import emptyArrayMatrix, sortedBranchIDList
 from pydynamo_brain.model import *
 
 import pydynamo_brain.files as files
 
+FILE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "files")
+
 PROPERTIES = ['added', 'filolengths', 'tdbl', 'masterChanged', 'transitioned', 'masterNodes', 'subtracted', 'filotypes']
 
 def convertMasterNodesFromNumpy(masterNodesNp):
@@ -166,6 +169,65 @@ def testImportNoChange(path='data/localFirst.dyn.gz'):
     assert np.array_equal(filoTypes[0], filoTypes[1])
     print ("🙌 Filotypes, filo lengths match!")
 
+def testExample2():
+    # Two timepoints, with an axon-labelled branch (0036, plus its subtree) only in the first.
+    trees = files.loadState(os.path.join(FILE_DIR, "example2.dyn.gz")).trees
+    branchIDs = sortedBranchIDList(trees)
+    assert len(branchIDs) == 59
+    axonIdx = branchIDs.index('0036')
+    axonSubtree = slice(axonIdx, axonIdx + 4)
+
+    expectedFiloTypes = [
+        [5, 1, 1, 5, 5, 1, 1, 5, 0, 5, 5, 1, 1, 5, 1, 1, 5, 1, 5, 1, 1, 1, 5, 5, 1, 5, 1, 5, 1, 5,
+         1, 1, 1, 1, 5, 1, 1, 5, 1, 5, 4, 2, 1, 5, 5, 5, 5, 5, 5, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+        [5, 0, 5, 5, 5, 0, 1, 5, 0, 5, 4, 1, 1, 5, 1, 1, 5, 1, 5, 1, 0, 1, 5, 5, 1, 4, 0, 5, 0, 5,
+         0, 1, 1, 1, 5, 0, 1, 5, 1, 5, 4, 0, 1, 5, 5, 5, 5, 5, 5, 1, 1, 1, 1, 1, 1, 2, 2, 1, 1],
+    ]
+    def idsWhere(mask):
+        return [branchIDs[i] for i in np.flatnonzero(mask)]
+
+    for excludeAxon in [False, True]:
+        filoTypes, added, subtracted, transitioned, masterChanged, masterNodes = addedSubtractedTransitioned(
+            trees, excludeAxon=excludeAxon, excludeBasal=False, terminalDist=5, filoDist=5)
+        motilities, filoLengths = motility(
+            trees, excludeAxon=excludeAxon, excludeBasal=False, terminalDist=5, filoDist=5)
+
+        expectedTypes = np.array(expectedFiloTypes)
+        if excludeAxon:
+            expectedTypes[0, axonSubtree] = FiloType.ABSENT
+        assert filoTypes.tolist() == expectedTypes.tolist()
+        assert idsWhere(added[0]) == ['003d', '003e', '003f', '0040', '0041', '0045', '0046', '004b', '004d']
+        assert idsWhere(subtracted[0]) == ['0001', '0006', '0016', '001c', '0020', '0023', '0029', '002f']
+        assert idsWhere(transitioned[0]) == ['0002']
+        expectedChanged = ['0002', '000c', '001b']
+        if excludeAxon:
+            expectedChanged += ['0036', '0038', '0039', '003a']
+        assert idsWhere(masterChanged[0]) == expectedChanged
+        assert len(masterNodes) == 2 and len(masterNodes[0]) == 59
+
+        # Excluded axon branches have no length, otherwise they're measured like any other:
+        assert np.isnan(filoLengths[0, axonSubtree]).all() == excludeAxon
+        assert abs(filoLengths[1, axonIdx] - 13.69705701) < 1e-6
+        expectedLengthSums = [400.36567503, 446.66307624] if excludeAxon else [473.54567432, 446.66307624]
+        assert np.allclose(np.nansum(filoLengths, axis=1), expectedLengthSums)
+
+        # Raw motility is the change in filo length, unless the branch changed master node:
+        raw = motilities['raw']
+        assert raw.shape == (1, 59)
+        assert np.isnan(raw[masterChanged]).all()
+        known = ~np.isnan(raw)
+        assert np.allclose(raw[known], (filoLengths[1:] - filoLengths[:-1])[known])
+        expectedSums = {
+            False: {'raw': -31.99020476, 'rawTDBL': -0.03599858, 'rawFilo': -0.07120066, 'rawNFilo': -1.23039249},
+            True: {'raw': -32.26460458, 'rawTDBL': -0.04612604, 'rawFilo': -0.08578354, 'rawNFilo': -1.24094633},
+        }[excludeAxon]
+        for key, expected in expectedSums.items():
+            assert abs(np.nansum(motilities[key]) - expected) < 1e-6, key
+
+def runFiles():
+    testExample2()
+    return True
+
 def run():
     np.set_printoptions(precision=3)
     testSimpleAST()
@@ -1,6 +1,94 @@
+import os
+import tempfile
+
 import pydynamo_brain.files as files
 
+FILE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "files")
+
+# Out of order IDs: children appear before their parents, and 7 hangs off a missing node 6.
+OUT_OF_ORDER_SWC = """# Out of order sample
+3 3 2.0 0.0 0.0 1.0 2
+1 1 0.0 0.0 0.0 2.0 -1
+5 3 1.0 1.0 0.0 1.0 1
+2 3 1.0 0.0 0.0 1.0 1
+4 3 3.0 0.0 0.0 1.0 3
+7 3 9.0 9.0 0.0 1.0 6
+9 3 2.0 1.0 0.0 0.5 3
+8 3 9.0 9.0 1.0 1.0 7
+"""
+
+def _readParents(path):
+    parents = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 7 and not parts[0].startswith('#'):
+                parents[parts[0]] = parts[6]
+    return parents
+
+def _checkParentLinks(tree, parents):
+    for point in tree.flattenPoints():
+        if point.isRoot():
+            assert parents[point.id] == '-1'
+        else:
+            assert point.nextPointInBranch(delta=-1).id == parents[point.id]
+
+def testScan1Auto():
+    path = os.path.join(FILE_DIR, "scan1Auto.swc")
+    parents = _readParents(path)
+    tree = files.importFromSWC(path)
+    assert tree is not None
+
+    points = tree.flattenPoints()
+    assert len(points) == len(parents) == 194
+    assert tree.rootPoint.id == '1'
+    assert tree.rootPoint.location == (229.0, 211.0, 25.0)
+    _checkParentLinks(tree, parents)
+
+    # One branch per root child, plus one per extra child of a non-root point.
+    childCount = {}
+    for parent in parents.values():
+        childCount[parent] = childCount.get(parent, 0) + 1
+    expectedBranches = childCount.get('1', 0) + sum(
+        max(0, count - 1) for pointID, count in childCount.items() if pointID not in ('1', '-1'))
+    assert len(tree.branches) == expectedBranches == 23
+    assert [p.id for p in tree.branches[0].points[:4]] == ['2', '3', '4', '5']
+    assert len(tree.branches[0].points) == 38
+    assert tree.branches[1].parentPoint.id == '1'
+    assert tree.branches[2].parentPoint.id == '3'
+
+def testOutOfOrderNodes():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "outOfOrder.swc")
+        with open(path, 'w') as f:
+            f.write(OUT_OF_ORDER_SWC)
+        tree = files.importFromSWC(path)
+    assert tree is not None
+
+    assert tree.rootPoint.id == '1'
+    assert tree.rootPoint.radius == 2.0
+    assert [b.id for b in tree.branches] == ['0000', '0001', '0002']
+    assert [b.parentPoint.id for b in tree.branches] == ['1', '1', '3']
+    assert [[p.id for p in b.points] for b in tree.branches] == [['5'], ['2', '3', '4'], ['9']]
+    assert tree.getPointByID('3').location == (2.0, 0.0, 0.0)
+
+    # The orphan and its child are never reached from the soma.
+    pointIDs = [p.id for p in tree.flattenPoints()]
+    assert sorted(pointIDs) == ['1', '2', '3', '4', '5', '9']
+    assert tree.getPointByID('7', includeDisconnected=True) is None
+    parents = {pointID: parent for pointID, parent in
+        (line.split()[0::6] for line in OUT_OF_ORDER_SWC.splitlines()[1:])}
+    _checkParentLinks(tree, parents)
+
+def runFiles():
+    testScan1Auto()
+    testOutOfOrderNodes()
+    return True
+
 def run(path='data/swcTest/7f_ss_cell1_step0_av2.tif_x122_y34_z26_app2.swc'):
     tree = files.importFromSWC(path)
     # TODO - verify tree struture
     return True
+
+if __name__ == '__main__':
+    runFiles()
@@ -27,8 +27,9 @@ def run(qtbot):
 
     # Click to open new stack:
     setNextTestPaths([scan1Path])
-    qtbot.mouseClick(dW.initialMenu.buttonN, Qt.LeftButton)
-    qtbot.waitUntil(lambda: len(dW.stackWindows) == 1)
+    with qtbot.waitSignal(dW.stacksOpened, timeout=5000):
+        qtbot.mouseClick(dW.initialMenu.buttonN, Qt.LeftButton)
+    assert len(dW.stackWindows) == 1
     sW = dW.stackWindows[0]
 
     assert len(dW.fullState.filePaths) == 1
@@ -54,8 +55,9 @@ def run(qtbot):
 
     # Add file for next stack:
     setNextTestPaths([scan2Path])
-    qtbot.keyClick(sW, 'n')
-    qtbot.waitUntil(lambda: len(dW.stackWindows) == 2)
+    with qtbot.waitSignal(dW.stacksOpened, timeout=5000):
+        qtbot.keyClick(sW, 'n')
+    assert len(dW.stackWindows) == 2
 
     assert len(dW.fullState.filePaths) == 2
     assert len(dW.fullState.trees) == 2
@@ -32,8 +32,9 @@ def run(qtbot):
 
     # Click to open new stack:
     setNextTestPaths([scan1Path])
-    qtbot.mouseClick(dW.initialMenu.buttonN, Qt.LeftButton)
-    qtbot.waitUntil(lambda: len(dW.stackWindows) == 1)
+    with qtbot.waitSignal(dW.stacksOpened, timeout=5000):
+        qtbot.mouseClick(dW.initialMenu.buttonN, Qt.LeftButton)
+    assert len(dW.stackWindows) == 1
     sW = dW.stackWindows[0]
     view = sW.dendrites.imgView.viewport()
 
@@ -3,9 +3,11 @@
 """
 
 import math
-import time
 
-from PyQt5.QtCore import Qt, QRectF, pyqtSignal, QT_VERSION_STR
+from contextlib import contextmanager
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt, QElapsedTimer, QRectF, QTimer, pyqtSignal, QT_VERSION_STR
 from PyQt5.QtGui import QImage, QPixmap, QPainterPath
 from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene, QFileDialog, QApplication
 
@@ -16,8 +18,14 @@ __author__ = "Marcel Goldschen-Ohm <marcel.goldschen@gmail.com>"
 __version__ = '0.9.0'
 
 SINGLE_CLICK_SEC = 0.2
+HOVER_UPDATE_MS = 16 # Most often to check what's under the mouse, ~60 times a second.
 SCROLL_SENSITIVITY = 100.0 # TODO - share with DendriteVolumeCanvas
 
+# Wheel deltas come in a few fixed steps, so the zoom scale for each is kept rather than recomputed.
+@lru_cache(maxsize=32)
+def _wheelZoomScale(yDelta):
+    return math.exp(-yDelta / SCROLL_SENSITIVITY)
+
 class QtImageViewer(QGraphicsView):
     """ PyQt image viewer widget for a QPixmap in a QGraphicsView scene with mouse zooming and panning.
 
@@ -73,12 +81,28 @@ class QtImageViewer(QGraphicsView):
         self.canPan = True
 
         # HACK - mouse click vs drag disambiguation
-        self.lastMousePressSec = -1
+        # Monotonic, so unaffected by wall clock changes. Invalid until the first press.
+        self._mousePressTimer = QElapsedTimer()
         self.lastMousePressPos = None
 
-        # HACK - ignore moving view twice when local change gets sent global, or initial zoom.
-        self.ignoreScrollChange = False
-        self.ignoreGlobalMoveViewRect = False
+        # Hover checks are throttled, with a trailing update so the final position isn't dropped.
+        self._hoverClock = QElapsedTimer()
+        self._hoverClock.start()
+        self._lastHoverMs = -HOVER_UPDATE_MS
+        self._pendingHoverPos = None
+        self._hoverTimer = QTimer(self)
+        self._hoverTimer.setSingleShot(True)
+        self._hoverTimer.timeout.connect(self._updateHover)
+        # Last point hovered over: (point, its location, circle radius in pixels, pixel scale at the time)
+        self._lastHoverCircle = None
+
+        # Scene size of one viewport pixel, cached until the view is next zoomed or resized.
+        self._sceneScale = None
+
+        # Number of view moves in progress here. Scroll changes and global moves they cause are ignored,
+        # rather than being sent around again.
+        self._viewMoveDepth = 0
+        # HACK - set to not broadcast a move to the other stacks, e.g. on initial zoom.
         self.onlyPerformLocalViewRect = False
 
         if imageData is not None:
@@ -121,6 +145,7 @@ class QtImageViewer(QGraphicsView):
         Raises a RuntimeError if the input image has type other than QImage or QPixmap.
         :type image: QImage | QPixmap
         """
+        self._lastHoverCircle = None # Points may have changed since.
         if type(image) is QPixmap:
             pixmap = image
         elif type(image) is QImage:
@@ -128,14 +153,18 @@ class QtImageViewer(QGraphicsView):
         else:
             raise RuntimeError("ImageViewer.setImage: Argument must be a QImage or QPixmap.")
         if self.hasImage():
+            sizeChanged = pixmap.size() != self._pixmapHandle.pixmap().size()
             self._pixmapHandle.setPixmap(pixmap)
         else:
+            sizeChanged = True
             self._pixmapHandle = self.scene.addPixmap(pixmap)
-        self.setSceneRect(QRectF(pixmap.rect()))  # Set scene size to image size.
+        if sizeChanged:
+            self.setSceneRect(QRectF(pixmap.rect()))  # Set scene size to image size.
         self.forceRepaint()
 
     def forceRepaint(self):
         """ Show current zoom (if showing entire image, apply current aspect ratio mode).
+        Note: update() only schedules a paint, so repeated calls before then are merged.
         """
         if not self.hasImage():
             return
@@ -144,6 +173,7 @@ class QtImageViewer(QGraphicsView):
     def resizeEvent(self, event):
         """ Maintain current zoom on resize.
         """
+        self._sceneScale = None
         self.forceRepaint()
         self.onlyPerformLocalViewRect = True
         self.zoom(0) # Force image to fit, but only in this screen.
@@ -153,22 +183,77 @@ class QtImageViewer(QGraphicsView):
     def mouseMoveEvent(self, event):
         QGraphicsView.mouseMoveEvent(self, event)
 
-        fullState = self.parentView.uiState.parent()
-        scenePos = self.mapToScene(event.pos())
-        zAt = zStackForUiState(self.parentView.uiState) * 1.0
+        # Nothing to hover over until the stack has a tree or puncta mode is on:
+        uiState = self.parentView.uiState
+        if uiState._tree.rootPoint is None and not uiState.parent().inPunctaMode():
+            self._hoverTimer.stop()
+            self._pendingHoverPos = None
+            self._setCursorShape(Qt.ArrowCursor)
+            return
+
+        self._pendingHoverPos = event.pos()
+        waitMs = HOVER_UPDATE_MS - (self._hoverClock.elapsed() - self._lastHoverMs)
+        if waitMs > 0:
+            if not self._hoverTimer.isActive():
+                self._hoverTimer.start(waitMs)
+            return
+        self._updateHover()
+
+    def _updateHover(self):
+        """ Update the cursor for whatever is under the latest mouse position.
+        """
+        self._hoverTimer.stop()
+        if self._pendingHoverPos is None:
+            return
+        hoverPos, self._pendingHoverPos = self._pendingHoverPos, None
+        self._lastHoverMs = self._hoverClock.elapsed()
+
+        scenePos = self.mapToScene(hoverPos)
+        zAt = float(zStackForUiState(self.parentView.uiState))
         location = (scenePos.x(), scenePos.y(), zAt)
 
         circleOver = None
         if self.parentView.uiState.parent().inPunctaMode():
             circleOver = self.parentView.punctaOnPixel(location)
         else:
-            circleOver = self.parentView.pointOnPixel(location)
-        self.viewport().setCursor(Qt.OpenHandCursor if circleOver is not None else Qt.ArrowCursor)
+            circleOver = self._stillInHoverCircle(location)
+            if circleOver is None:
+                circleOver = self.parentView.pointOnPixel(location)
+                self._rememberHoverCircle(circleOver)
+        self._setCursorShape(Qt.OpenHandCursor if circleOver is not None else Qt.ArrowCursor)
+
+    def _setCursorShape(self, shape):
+        # Read back the current shape rather than tracking it, as dragging also changes the cursor.
+        viewport = self.viewport()
+        if viewport.cursor().shape() != shape:
+            viewport.setCursor(shape)
+
+    def _rememberHoverCircle(self, point):
+        if point is None:
+            self._lastHoverCircle = None
+        else:
+            radiusPx = self.parentView.pointRadiusPx(point)
+            self._lastHoverCircle = (point, point.location, radiusPx, self.pixelScale())
+
+    def _stillInHoverCircle(self, location):
+        """ Point last hovered over, if location is certainly still inside its circle, otherwise None.
+        """
+        if self._lastHoverCircle is None:
+            return None
+        point, center, radiusPx, pixelScale = self._lastHoverCircle
+        if pixelScale != self.pixelScale() or round(center[2]) != round(location[2]):
+            return None
+        scale = max(pixelScale)
+        dX, dY, dZ = (location[0] - center[0]) * scale, (location[1] - center[1]) * scale, location[2] - center[2]
+        # Zoomed locations are rounded to whole pixels, so keep that far inside the circle:
+        if math.hypot(dX, dY, dZ) + 1.5 <= radiusPx:
+            return point
+        return None
 
     def mousePressEvent(self, event):
         """ Start mouse pan or zoom mode.
         """
-        self.lastMousePressSec = time.time()
+        self._mousePressTimer.start()
         self.lastMousePressPos = event.pos()
 
         scenePos = self.mapToScene(event.pos())
@@ -185,8 +270,9 @@ class QtImageViewer(QGraphicsView):
     def mouseReleaseEvent(self, event):
         """ Stop mouse pan or zoom mode (apply zoom if valid).
         """
-        timeDiff = time.time() - self.lastMousePressSec
-        if timeDiff < SINGLE_CLICK_SEC: # TODO - check distance
+        isClick = self._mousePressTimer.isValid() and \
+            self._mousePressTimer.elapsed() < SINGLE_CLICK_SEC * 1000
+        if isClick: # TODO - check distance
             scenePos = self.mapToScene(event.pos())
             self.parentView.mouseClickEvent(event, scenePos)
             QGraphicsView.mouseReleaseEvent(self, event)
@@ -202,8 +288,7 @@ class QtImageViewer(QGraphicsView):
                 selectionBBox = self.scene.selectionArea().boundingRect()
                 self.scene.setSelectionArea(QPainterPath())  # Clear current selection area.
                 if selectionBBox.isValid():
-                    self.moveViewRect(selectionBBox)
-                    self.forceRepaint()
+                    self.moveViewRect(selectionBBox) # Repaints via fitInView
             self.setDragMode(QGraphicsView.NoDrag)
             self.rightMouseButtonReleased.emit(scenePos.x(), scenePos.y())
 
@@ -228,36 +313,45 @@ class QtImageViewer(QGraphicsView):
             event.accept()
 
     def handleZoomScroll(self, yDelta):
-        self.zoom(-yDelta / SCROLL_SENSITIVITY)
+        self.zoomByScale(_wheelZoomScale(yDelta))
 
     def zoom(self, logAmount):
-        scale = math.exp(logAmount)
+        self.zoomByScale(math.exp(logAmount))
+
+    def zoomByScale(self, scale):
         border = self.getViewportRect()
         mid = border.center()
 
-        border.translate(-mid)
-        border = QRectF(border.topLeft() * scale, border.bottomRight() * scale)
-        border.translate(mid)
+        # Scale the view rect around its center:
+        w, h = border.width() * scale, border.height() * scale
+        border = QRectF(mid.x() - w / 2, mid.y() - h / 2, w, h)
         self.moveViewRect(border.intersected(self.sceneRect()))
 
+    @contextmanager
+    def _movingView(self):
+        self._viewMoveDepth += 1
+        try:
+            yield
+        finally:
+            self._viewMoveDepth -= 1
+
     def moveViewRect(self, newViewRect, alreadySetFromScroll=False):
-        self.ignoreGlobalMoveViewRect = True
-        if not alreadySetFromScroll:
-            self.fitInView(newViewRect, self.aspectRatioMode) # Only set locally if not done already...
-        if not self.onlyPerformLocalViewRect:
-            self.parentView.dynamoWindow.handleDendriteMoveViewRect(newViewRect, self.parentView.stackWindow)
-        self.ignoreGlobalMoveViewRect = False
+        with self._movingView():
+            if not alreadySetFromScroll:
+                self.fitInView(newViewRect, self.aspectRatioMode) # Only set locally if not done already...
+                self._sceneScale = None
+            if not self.onlyPerformLocalViewRect:
+                self.parentView.dynamoWindow.handleDendriteMoveViewRect(newViewRect, self.parentView.stackWindow)
 
     def handleGlobalMoveViewRect(self, newViewRect):
-        if self.ignoreGlobalMoveViewRect:
+        if self._viewMoveDepth > 0:
             return
-        self.ignoreScrollChange = True
-        self.fitInView(newViewRect, self.aspectRatioMode)
-        self.forceRepaint()
-        self.ignoreScrollChange = False
+        with self._movingView():
+            self.fitInView(newViewRect, self.aspectRatioMode) # Also schedules the repaint
+            self._sceneScale = None
 
     def viewportChangedByScroll(self, event):
-        if self.ignoreScrollChange:
+        if self._viewMoveDepth > 0:
             return
         self.moveViewRect(self.getViewportRect(), alreadySetFromScroll=True)
 
@@ -265,18 +359,27 @@ class QtImageViewer(QGraphicsView):
         return self.mapToScene(self.viewport().geometry()).boundingRect()
 
     def toSceneDist(self, pixelDistX, pixelDistY):
-        mappedA = self.mapToScene(0, 0)
-        mappedB = self.mapToScene(int(pixelDistX), int(pixelDistY))
-        dX, dY = mappedB.x() - mappedA.x(), mappedB.y() - mappedA.y()
-        return dX, dY
+        # View only scales and translates, so distances are the pixel distance times the scale.
+        if self._sceneScale is None:
+            mappedA = self.mapToScene(0, 0)
+            mappedB = self.mapToScene(1, 1)
+            self._sceneScale = (mappedB.x() - mappedA.x(), mappedB.y() - mappedA.y())
+        scaleX, scaleY = self._sceneScale
+        return int(pixelDistX) * scaleX, int(pixelDistY) * scaleY
 
     # invert toSceneDist
     def fromSceneDist(self, sceneDistX, sceneDistY):
+        scaleX, scaleY = self.pixelScale()
+        return sceneDistX * scaleX, sceneDistY * scaleY
+
+    def pixelScale(self):
+        """ Viewport pixels per scene unit, (x, y). Inverse of toSceneDist(1, 1).
+        """
         # toSceneDist(1, 1) = x, y
         # => toSceneDist(sdX, sdY) = sdX * x, sdY * y
         # => toSceneDist(sdX/x, sdY/y) = sdX, sdY
-        x, y = self.toSceneDist(1, 1)
-        return sceneDistX / x, sceneDistY / y
+        x, y = self.toSceneDist(1, 1) # Cached, so cheap to call.
+        return 1.0 / x, 1.0 / y
 
     def sceneDimension(self):
         viewRect = self.getViewportRect()
@@ -21,6 +21,8 @@ class DendriteOverlay(QWidget):
     def paintEvent(self, event):
         super().paintEvent(event)
         fullState = self.dendriteCanvas.uiState.parent()
+        imgView = self.dendriteCanvas.imgView
+        zoomScale = imgView.pixelScale() # Same for every item, so look up once per paint.
         p = QPainter()
         p.begin(self)
 
@@ -31,19 +33,19 @@ class DendriteOverlay(QWidget):
             PunctaPainter(p,
                 self.windowIndex,
                 self.dendriteCanvas.uiState,
-                self.dendriteCanvas.imgView.mapFromScene,
-                self.dendriteCanvas.imgView.fromSceneDist
+                imgView.mapFromScene,
+                zoomScale
             ).drawPuncta(puncta)
         elif fullState.inRadiiMode():
             RadiiPainter(p,
                 self.dendriteCanvas.uiState,
-                self.dendriteCanvas.imgView.mapFromScene,
-                self.dendriteCanvas.imgView.fromSceneDist
+                imgView.mapFromScene,
+                zoomScale
             ).drawTree(self.dendriteCanvas.uiState._tree)
         else:
             DendritePainter(p,
                 self.dendriteCanvas.uiState,
-                self.dendriteCanvas.imgView.mapFromScene,
-                self.dendriteCanvas.imgView.fromSceneDist
+                imgView.mapFromScene,
+                zoomScale
             ).drawTree(self.dendriteCanvas.uiState._tree)
         p.end()
@@ -32,12 +32,12 @@ class DendritePainter():
     ANNOTATION_HEIGHT = 40
     ANNOTATION_MAX_WIDTH = 512
 
-    def __init__(self, painter, uiState, zoomMapFunc, zoomDistFunc):
+    def __init__(self, painter, uiState, zoomMapFunc, zoomScale):
         self.p = painter
         self.uiState = uiState
         self.zAt = self.uiState.zAxisAt
         self.zoomMapFunc = zoomMapFunc
-        self.zoomDistFunc = zoomDistFunc
+        self.zoomScaleX, self.zoomScaleY = zoomScale # Viewport pixels per scene unit
 
     def drawTree(self, tree):
         if self.uiState.hideAll:
@@ -101,7 +101,7 @@ class DendritePainter():
         self.p.setPen(self.NODE_CIRCLE_PEN)
         self.p.setBrush(brushColor)
         if resizeRadius:
-            radiusX, radiusY = self.zoomDistFunc(radius, radius)
+            radiusX, radiusY = radius * self.zoomScaleX, radius * self.zoomScaleY
         else:
             radiusX, radiusY = radius, radius
         self.p.drawEllipse(QPointF(x, y), radiusX, radiusY)
@@ -5,6 +5,8 @@ from PyQt5.QtWidgets import QWidget, QGridLayout, QApplication, QLayout
 import math
 import numpy as np
 
+from scipy.spatial import cKDTree
+
 from .baseMatplotlibCanvas import BaseMatplotlibCanvas
 from .np2qt import np2qt
 from .QtImageViewer import QtImageViewer
@@ -12,7 +14,7 @@ from .dendritePainter import DendritePainter
 from .dendriteOverlay import DendriteOverlay
 
 from pydynamo_brain.model import Point
-from pydynamo_brain.util import ImageCache, deltaSz, snapToRange, zStackForUiState
+from pydynamo_brain.util import ImageCache, deltaSz, deltaSzArray, snapToRange, zStackForUiState
 
 
 _IMGCACHE = ImageCache()
@@ -38,6 +40,12 @@ class DendriteVolumeCanvas(QWidget):
         )
         self.imgOverlay = DendriteOverlay(self, windowIndex)
 
+        # Flattened points of the drawn tree, reused by hover and click lookups until the next draw.
+        self._flatPoints = None
+        self._flatPointsTree = None
+        # Same lifetime: for each Z, (points, index of their x/y, largest real radius)
+        self._zPointIndex = {}
+
         l = QGridLayout(self)
         l.setContentsMargins(0, 0, 0, 0)
         # l.setSizeConstraint(QLayout.SetFixedSize)
@@ -61,6 +69,8 @@ class DendriteVolumeCanvas(QWidget):
         self.drawImage()
 
     def drawImage(self):
+        self._flatPoints = None
+        self._zPointIndex = {}
         c1, c2 = self.uiState.colorLimits
         imageData = self.currentImg()
         imageData = imageData / np.amax(imageData)
@@ -73,7 +83,7 @@ class DendriteVolumeCanvas(QWidget):
     def mouseClickEvent(self, event, pos):
         try:
             super(DendriteVolumeCanvas, self).mousePressEvent(event)
-            zAt = zStackForUiState(self.uiState) * 1.0
+            zAt = float(zStackForUiState(self.uiState))
             location = (pos.x(), pos.y(), zAt)
 
             # Shortcut out if the stack's tree is hidden:
@@ -201,50 +211,106 @@ class DendriteVolumeCanvas(QWidget):
         dotSize = self.uiState.parent().dotSize
 
         # TODO - share with below
-        closestDist, closestPoint = None, None
-        allPoints = self.uiState._tree.flattenPoints()
-        for point in allPoints:
-            if zFilter and round(point.location[2]) != round(location[2]):
-                continue
-
-            radius = dotSize
-            resizeRadius = False
-            if radius is None:
-                radius = point.radius
-                resizeRadius = (point.radius is not None)
-            if radius is None:
-                radius = DendritePainter.NODE_CIRCLE_DEFAULT_RADIUS
-            if resizeRadius:
-                radius, _ = self.imgView.fromSceneDist(radius, radius)
-
-            # TODO - verify this always needs to happen, but not below?
-            zLoc = self.zoomedLocation(location)
-            zPLoc = self.zoomedLocation(point.location)
-            dist = deltaSz(zLoc, zPLoc)
-            if dist > radius:
-                continue
-            if closestDist is None or dist < closestDist:
-                closestDist, closestPoint = dist, point
-
-        return closestPoint
+        allPoints = self.pointsNearOnZ(location, dotSize) if zFilter else self.treePoints()
+        if len(allPoints) == 0:
+            return None
+
+        # Circle size of each point, in zoomed pixels:
+        if dotSize is not None:
+            radii = np.full(len(allPoints), dotSize, dtype=np.float64)
+        else:
+            sceneDistX, _ = self.imgView.toSceneDist(1, 1)
+            radii = np.array([
+                DendritePainter.NODE_CIRCLE_DEFAULT_RADIUS if p.radius is None else p.radius / sceneDistX
+                for p in allPoints
+            ], dtype=np.float64)
+
+        # TODO - verify this always needs to happen, but not below?
+        zLoc = self.zoomedLocation(location)
+        zPLocs = self.zoomedLocations(np.array([p.location for p in allPoints], dtype=np.float64))
+        return _closestWithinRadius(allPoints, deltaSzArray(zPLocs, zLoc), radii)
+
+    def treePoints(self):
+        """All points in the current tree, cached until the next draw as hovering looks them up every move."""
+        tree = self.uiState._tree
+        if self._flatPoints is None or self._flatPointsTree is not tree:
+            self._flatPoints = tree.flattenPoints()
+            self._flatPointsTree = tree
+            self._zPointIndex = {}
+        return self._flatPoints
+
+    def pointRadiusPx(self, point):
+        """Radius of a point's circle in zoomed pixels, as used by pointOnPixel."""
+        dotSize = self.uiState.parent().dotSize
+        if dotSize is not None:
+            return dotSize
+        if point.radius is None:
+            return DendritePainter.NODE_CIRCLE_DEFAULT_RADIUS
+        sceneDistX, _ = self.imgView.toSceneDist(1, 1)
+        return point.radius / sceneDistX
+
+    def pointsNearOnZ(self, location, dotSize):
+        """Points on the same Z as location whose circle might contain it, in flattened order.
+        Superset of the hits, found using a spatial index of the points on each Z."""
+        allPoints = self.treePoints()
+        targetZ = round(location[2])
+        if targetZ not in self._zPointIndex:
+            zPoints = [p for p in allPoints if round(p.location[2]) == targetZ]
+            zIndex = None
+            if len(zPoints) > 0:
+                zIndex = cKDTree(np.array([p.location[:2] for p in zPoints], dtype=np.float64))
+            maxRealRadius = max((p.radius for p in zPoints if p.radius is not None), default=None)
+            self._zPointIndex[targetZ] = (zPoints, zIndex, maxRealRadius)
+        zPoints, zIndex, maxRealRadius = self._zPointIndex[targetZ]
+        if zIndex is None:
+            return []
+
+        # Largest circle size, in zoomed pixels, matching the radii used by pointOnPixel:
+        scaleX, scaleY = self.imgView.pixelScale()
+        if dotSize is not None:
+            maxRadius = dotSize
+        else:
+            maxRadius = DendritePainter.NODE_CIRCLE_DEFAULT_RADIUS
+            if maxRealRadius is not None:
+                maxRadius = max(maxRadius, maxRealRadius * scaleX)
+        # Zoomed locations are rounded to whole pixels, so allow up to a pixel per axis either way.
+        sceneRadius = (maxRadius + 1.5) / min(scaleX, scaleY)
+        near = zIndex.query_ball_point(location[:2], sceneRadius)
+        return [zPoints[i] for i in sorted(near)]
 
     def punctaOnPixel(self, location, zFilter=True):
         # TODO - share with above
-        closestDist, closestPoint = None, None
-        if self.windowIndex < len(self.uiState._parent.puncta):
-            allPoints = self.uiState._parent.puncta[self.windowIndex]
-            for point in allPoints:
-                if zFilter and round(point.location[2]) != round(location[2]):
-                    continue
-                dist = deltaSz(location, point.location)
-                if dist > point.radius:
-                    continue
-                if closestDist is None or dist < closestDist:
-                    closestDist, closestPoint = dist, point
-        return closestPoint
+        if self.windowIndex >= len(self.uiState._parent.puncta):
+            return None
+        allPoints = self.uiState._parent.puncta[self.windowIndex]
+        if zFilter:
+            targetZ = round(location[2])
+            allPoints = [p for p in allPoints if round(p.location[2]) == targetZ]
+        if len(allPoints) == 0:
+            return None
+        locations = np.array([p.location for p in allPoints], dtype=np.float64)
+        radii = np.array([p.radius for p in allPoints], dtype=np.float64)
+        return _closestWithinRadius(allPoints, deltaSzArray(locations, location), radii)
 
     # TODO - share with dendrite painter.
     def zoomedLocation(self, xyz):
         x, y, z = xyz
         zoomedXY = self.imgView.mapFromScene(x, y)
         return (zoomedXY.x(), zoomedXY.y(), z)
+
+    # Same as zoomedLocation, for an (N, 3) array of locations.
+    def zoomedLocations(self, xyzs):
+        # Note: Same as mapFromScene, including rounding to whole pixels.
+        transform = self.imgView.viewportTransform()
+        x, y = xyzs[:, 0], xyzs[:, 1]
+        zoomed = np.array(xyzs, dtype=np.float64)
+        zoomed[:, 0] = np.floor(transform.m11() * x + transform.m21() * y + transform.dx() + 0.5)
+        zoomed[:, 1] = np.floor(transform.m12() * x + transform.m22() * y + transform.dy() + 0.5)
+        return zoomed
+
+# Given points and their distances, return the closest within its own radius, if any.
+def _closestWithinRadius(points, dists, radii):
+    inRange = np.flatnonzero(dists <= radii)
+    if len(inRange) == 0:
+        return None
+    return points[inRange[np.argmin(dists[inRange])]]
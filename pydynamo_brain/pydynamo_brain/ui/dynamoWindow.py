@@ -21,6 +21,9 @@ from .stackWindow import StackWindow
 from .tilefigs import tileFigs
 
 class DynamoWindow(QtWidgets.QMainWindow):
+    # Emitted once new stack windows have been opened and tiled.
+    stacksOpened = QtCore.pyqtSignal()
+
     def __init__(self, app, argv):
         QtWidgets.QMainWindow.__init__(self, None)
         self.app = app
@@ -336,6 +339,7 @@ class DynamoWindow(QtWidgets.QMainWindow):
             if lastWindow is not None:
                 lastWindow.setFocus(True)
                 break
+        self.stacksOpened.emit()
 
     def removeStackWindow(self, windowIndex, deleteData=False):
         if not deleteData:
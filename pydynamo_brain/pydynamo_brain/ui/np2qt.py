@@ -4,6 +4,8 @@ from PyQt5.QtGui import QImage, qRgb
 import matplotlib.pyplot as plt
 import numpy as np
 
+from typing import Dict, List
+
 def PyQt_data(image):
     # PyQt4/PyQt5's QImage.bits() returns a sip.voidptr that supports
     # conversion to string via asstring(size) or getting its base
@@ -49,8 +51,9 @@ def _normalize255(array, normalize, clip = (0, 255)):
     return array
 
 def np2qt(gray, cmapID=None, normalize=False, channel=None):
-    """Convert the 2D numpy array `gray` into a 8-bit, indexed QImage_
-    with a gray colormap.  The first dimension represents the vertical
+    """Convert the 2D numpy array `gray` into a 8-bit grayscale QImage_
+    (indexed, if shown in a single color `channel`, or 32-bit if given a
+    matplotlib `cmapID`).  The first dimension represents the vertical
     image axis.
     The parameter `normalize` can be used to normalize an image's
     value range to 0..255:
@@ -71,26 +74,35 @@ def np2qt(gray, cmapID=None, normalize=False, channel=None):
                          " (try using array2qimage)" if np.ndim(gray) == 3 else "")
 
     h, w = gray.shape
-    result = QImage(w, h, QImage.Format_Indexed8)
     if cmapID is not None:
+        # Colormap straight to bytes, in a layout Qt converts to a pixmap with a fast swizzle.
         cmap = plt.get_cmap(cmapID)
-        gray = cmap(gray)[:,:, :3]*255
-        """gray = gray[:,:, :3]
-        gray = gray* 255"""
-        gray = gray.astype('uint8')
-        result = QImage(gray, w, h,  QImage.Format_RGB888)
-
+        rgba = np.ascontiguousarray(cmap(gray, bytes=True))
+        result = QImage(rgba.data, w, h, 4 * w, QImage.Format_RGBX8888)
+        result.ndarray = rgba # Keep the pixel buffer alive as long as the image.
         return result
+
+    if channel is None:
+        result = QImage(w, h, QImage.Format_Grayscale8) # No color table lookup needed.
+    else:
+        result = QImage(w, h, QImage.Format_Indexed8)
+        result.setColorTable(_channelColorTable(channel))
     if not np.ma.is_masked(gray):
-        for i in range(256):
-            if channel == 'r':
-                result.setColor(i, qRgb(i,0,0))
-            elif channel == 'g':
-                result.setColor(i, qRgb(0,i,0))
-            elif channel == 'b':
-                result.setColor(i, qRgb(0,0,i))
-            else:
-                result.setColor(i, qRgb(i,i,i))
-        else:
-            qimageview(result)[:] = _normalize255(gray, normalize)
+        qimageview(result)[:] = _normalize255(gray, normalize)
     return result
+
+_COLOR_TABLES: Dict[str, List[int]] = {}
+
+# 256-entry color table for an 8-bit image shown in a single color channel.
+def _channelColorTable(channel):
+    if channel not in _COLOR_TABLES:
+        if channel == 'r':
+            table = [qRgb(i, 0, 0) for i in range(256)]
+        elif channel == 'g':
+            table = [qRgb(0, i, 0) for i in range(256)]
+        elif channel == 'b':
+            table = [qRgb(0, 0, i) for i in range(256)]
+        else:
+            table = [qRgb(i, i, i) for i in range(256)]
+        _COLOR_TABLES[channel] = table
+    return _COLOR_TABLES[channel]
@@ -21,14 +21,14 @@ class PunctaPainter():
     ANNOTATION_MAX_WIDTH = 512
 
     def __init__(self, painter, windowIndex, uiState,
-        zoomMapFunc, zoomDistFunc
+        zoomMapFunc, zoomScale
     ):
         self.p = painter
         self.windowIndex = windowIndex
         self.uiState = uiState
         self.zAt = self.uiState.zAxisAt
         self.zoomMapFunc = zoomMapFunc
-        self.zoomDistFunc = zoomDistFunc
+        self.zoomScaleX, self.zoomScaleY = zoomScale # Viewport pixels per scene unit
 
     def updateWindowIndex(self, windowIndex):
         self.windowIndex = windowIndex
@@ -63,7 +63,7 @@ class PunctaPainter():
 
     def drawCircle(self, x, y, sameZ, radiusPx, isCurrent):
         assert radiusPx is not None
-        radiusX, radiusY = self.zoomDistFunc(radiusPx, radiusPx)
+        radiusX, radiusY = radiusPx * self.zoomScaleX, radiusPx * self.zoomScaleY
         pen = self.NODE_CIRCLE_PEN
         brush = self.NODE_CIRCLE_BRUSH
         if isCurrent:
@@ -96,7 +96,7 @@ class PunctaPainter():
 
         self.p.setFont(self.ANNOTATION_FONT)
         self.p.setPen(self.ANNOTATION_PEN)
-        radiusX, _ = self.zoomDistFunc(point.radius, 0)
+        radiusX = point.radius * self.zoomScaleX
 
         textRect = QRectF(
             x + radiusX + self.ANNOTATION_OFFSET, y - self.ANNOTATION_HEIGHT / 2,
@@ -36,12 +36,12 @@ class RadiiPainter():
     RADIUS_COLOR_SELECTED = (11, 219, 209)
     RADIUS_COLOR_IS_MARKED = (255, 108, 180)
 
-    def __init__(self, painter, uiState, zoomMapFunc, zoomDistFunc):
+    def __init__(self, painter, uiState, zoomMapFunc, zoomScale):
         self.p = painter
         self.uiState = uiState
         self.zAt = self.uiState.zAxisAt
         self.zoomMapFunc = zoomMapFunc
-        self.zoomDistFunc = zoomDistFunc
+        self.zoomScaleX, self.zoomScaleY = zoomScale # Viewport pixels per scene unit
 
     def drawTree(self, tree):
         if self.uiState.hideAll:
@@ -139,7 +139,7 @@ class RadiiPainter():
         radiusX, radiusY = radius, radius
 
         # Scale radius for image view
-        radius2Draw, junk = self.zoomDistFunc(radius2Draw, radius2Draw)
+        radius2Draw = radius2Draw * self.zoomScaleX
         # Calculate the line to represent neurite radius
         x1, y1, x2, y2 = self.returnRadiusCoord(point, radius2Draw)
 
@@ -159,9 +159,9 @@ class RadiiPainter():
 
         if point == self.uiState.currentPoint():
             if point.radius is not None:
-                radiusX, radiusY = self.zoomDistFunc(point.radius, point.radius)
+                radiusX, radiusY = point.radius * self.zoomScaleX, point.radius * self.zoomScaleY
         elif resizeRadius:
-            radiusX, radiusY = self.zoomDistFunc(radius, radius)
+            radiusX, radiusY = radius * self.zoomScaleX, radius * self.zoomScaleY
         else:
             radiusX, radiusY = radius, radius
 
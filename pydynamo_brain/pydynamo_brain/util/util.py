@@ -19,7 +19,11 @@ def currentTimeMillis():
     return int(round(time.time() * 1000))
 
 def snapToRange(x, lo, hi):
-    return np.maximum(lo, np.minimum(hi, x))
+    if isinstance(x, np.ndarray):
+        return np.clip(x, lo, hi)
+    # Scalars skip numpy dispatch. Note: lo wins if the range is empty.
+    x = hi if x > hi else x
+    return lo if x < lo else x
 
 # Given two tuples A = (Ax, Ay, Az), B = (Bx, By, Bz), return A + B
 def locationPlus(A: Point3D, B: Point3D) -> Point3D:
@@ -31,43 +35,45 @@ def locationMinus(A: Point3D, B: Point3D) -> Point3D:
 
 def normDelta(p1, p2):
     x, y, z = locationMinus(p1, p2)
-    sz = math.sqrt(x*x + y*y + z*z)
+    sz = math.hypot(x, y, z)
     return (x/sz, y/sz, z/sz)
 
 def dotDelta(p1, p2):
     return p1[0] * p2[0] + p1[1] * p2[1] + p1[2] * p2[2]
 
 def deltaSz(p1: Point3D, p2: Point3D) -> float:
-    x, y, z = locationMinus(p1, p2)
-    return math.sqrt(x*x + y*y + z*z)
+    return math.hypot(p1[0] - p2[0], p1[1] - p2[1], p1[2] - p2[2])
+
+# Distances between (..., 3) arrays of locations, broadcasting e.g. many points against one.
+def deltaSzArray(A, B):
+    delta = np.asarray(A, dtype=np.float64) - np.asarray(B, dtype=np.float64)
+    return np.sqrt(np.einsum('...i,...i->...', delta, delta))
 
 # TODO - remove
-def rotation_matrix(axis, theta):
+def rotation_matrix(axis, theta, out=None):
     """
     Return the rotation matrix associated with counterclockwise rotation about
-    the given axis by theta radians.
+    the given axis by theta radians. If given, the (3, 3) out array is filled and returned.
     """
-    axis = np.asarray(axis)
-    axis = axis/math.sqrt(np.dot(axis, axis))
+    x, y, z = (float(v) for v in axis)
+    axisSz = math.sqrt(x*x + y*y + z*z)
     a = math.cos(theta/2.0)
-    b, c, d = -axis*math.sin(theta/2.0)
+    s = -math.sin(theta/2.0) / axisSz
+    b, c, d = x*s, y*s, z*s
     aa, bb, cc, dd = a*a, b*b, c*c, d*d
     bc, ad, ac, ab, bd, cd = b*c, a*d, a*c, a*b, b*d, c*d
-    return np.array([[aa+bb-cc-dd, 2*(bc+ad), 2*(bd-ac)],
-                     [2*(bc-ad), aa+cc-bb-dd, 2*(cd+ab)],
-                     [2*(bd+ac), 2*(cd-ab), aa+dd-bb-cc]])
+    if out is None:
+        out = np.empty((3, 3))
+    out[0, 0], out[0, 1], out[0, 2] = aa+bb-cc-dd, 2*(bc+ad), 2*(bd-ac)
+    out[1, 0], out[1, 1], out[1, 2] = 2*(bc-ad), aa+cc-bb-dd, 2*(cd+ab)
+    out[2, 0], out[2, 1], out[2, 2] = 2*(bd+ac), 2*(cd-ab), aa+dd-bb-cc
+    return out
 
 def emptyArrayArray(c):
-    d = []
-    for i in range(c):
-        d.append([])
-    return d
+    return [[] for _ in range(c)]
 
 def emptyArrayMatrix(r, c):
-    d = []
-    for i in range(r):
-        d.append(emptyArrayArray(c))
-    return d
+    return [[[] for _ in range(c)] for _ in range(r)]
 
 def lastPointWithLabelIdx(points, label):
     lastPointIdx = -1
@@ -76,6 +82,10 @@ def lastPointWithLabelIdx(points, label):
             lastPointIdx = i
     return lastPointIdx
 
+# Whether any point's label contains the given text, stopping at the first match.
+def hasPointWithLabel(points, label):
+    return any(label in point.annotation for point in points)
+
 # Sorted list of all branch IDs found in the given list of trees.
 def sortedBranchIDList(trees):
     ids = set()
@@ -40,6 +40,11 @@ def test_motility():
     assert motilityTest.run()
     print ("")
 
+def test_motilityFiles():
+    print ("Motility files test...")
+    assert motilityTest.runFiles()
+    print ("")
+
 def test_recursiveAdjust():
     print ("Recursive Adjust test...")
     assert recursiveAdjustTest.run()
@@ -55,6 +60,11 @@ def test_SWC():
     assert swcTest.run()
     print ("")
 
+def test_SWCFiles():
+    print ("SWC files test...")
+    assert swcTest.runFiles()
+    print ("")
+
 def test_uiDraw(qtbot):
     print ("UI draw test...")
     assert uiDrawTest.run(qtbot)
@@ -76,8 +86,10 @@ if __name__ == '__main__':
     test_absOrient()
     test_history()
     test_motility()
+    test_motilityFiles()
     test_recursiveAdjust()
     test_sholl()
     test_SWC()
+    test_SWCFiles()
     test_dendrogram()
     print ("\n 🙌🙌🙌 ALL NON-UI TESTS PASSED 🙌🙌🙌\n")